@@ -14,9 +14,19 @@ DECISION_INTERVAL = int(os.getenv('DECISION_INTERVAL', '300'))  # seconds
 # Trading pairs to monitor
 TRADING_PAIRS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'SOLUSDT', 'ADAUSDT']
 
+# Stream prices over Binance WebSocket instead of polling REST
+USE_PRICE_STREAM = os.getenv('USE_PRICE_STREAM', 'false').lower() == 'true'
+
 # LLM Configuration
 LLM_MODEL = 'qwen3-max'
 LLM_TEMPERATURE = 0.7
+LLM_MAX_CONCURRENCY = 4  # Max in-flight LLM requests
+LLM_BATCH_SIZE = 4  # Prompts packed into one request by make_decisions_batched
+# Mark the system prompt with cache_control (DashScope explicit context cache)
+LLM_EXPLICIT_CACHE = os.getenv('LLM_EXPLICIT_CACHE', 'false').lower() == 'true'
+DECISION_CACHE_TTL = 60  # seconds a decision is reused for unchanged market inputs
+PROMPT_SERIES_POINTS = 10  # most recent points per intraday series sent to the LLM
+DECISION_CACHE_DIGITS = 4  # significant digits kept when fingerprinting market inputs
 
 # Token optimization settings - Multi-level wake-up thresholds
 VOLATILITY_THRESHOLD = 0.02  # 2% normal volatility (普通波动)
@@ -25,4 +35,11 @@ POSITION_RISK_THRESHOLD = 0.02  # 2% for positions (持仓风险阈值)
 MARKET_VOLATILITY_COINS = 3  # Number of coins for market-wide volatility (联动波动币种数)
 COOLDOWN_SECONDS = 30  # Cooldown period after LLM call (冷却时间)
 MAX_HISTORY_ITEMS = 20  # Maximum historical data points to keep
+CHART_HISTORY_ITEMS = 8640  # Value/price points kept in memory per series for charts (1 day at 10s)
+SHUTDOWN_PRICE_MAX_AGE = 60  # Seconds the last iteration's prices stay usable at shutdown
+
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # DEBUG also logs the per-iteration price line
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Roll the session log over at this size (0 disables rotation)
+LOG_BACKUP_COUNT = 5  # Rolled-over session logs kept as .1 ... .N
 
@@ -2,20 +2,131 @@
 Cryptocurrency price data fetching module using Binance API
 """
 
+import json
+import numpy as np
 import requests
-from typing import Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+import inspect
+import threading
 import time
 from datetime import datetime
+from price_stream import PriceStream
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    orjson = None
+
+
+def _loads(data: bytes):
+    """Parse a JSON response body"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def ttl_cache(ttl: float = 60):
+    """
+    Memoize a method per instance for ttl seconds
+    
+    Empty results (None or zero-length) are treated as failures and not cached.
+    Expired entries are refetched lazily on the next call.
+    """
+    def decorator(func):
+        lock = threading.Lock()
+        attr = f"_ttl_cache_{func.__name__}"
+        signature = inspect.signature(func)
+        
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            # Normalize positional/keyword/default spellings of the same call
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.values())[1:]
+            now = time.monotonic()
+            with lock:
+                cache = self.__dict__.setdefault(attr, {})
+                entry = cache.get(key)
+                if entry is not None and now - entry[0] < ttl:
+                    return entry[1]
+            
+            value = func(self, *args, **kwargs)
+            if value is not None and len(value) > 0:
+                with lock:
+                    cache[key] = (now, value)
+            return value
+        
+        return wrapper
+    return decorator
 
 
 class CryptoAPI:
     """Fetches real-time cryptocurrency prices from Binance"""
     
     BASE_URL = "https://api.binance.com/api/v3"
+    KLINE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+    CACHE_TTL = 1.0  # seconds a batched /ticker/price snapshot stays fresh
+    MAX_WORKERS = 8  # concurrent requests for the *_batch helpers
+    KLINE_TAIL = 2  # candles refetched on refresh: the last closed one and the forming one
     
     def __init__(self):
         self.session = requests.Session()
+        # Keep connections to Binance alive across bursts instead of re-handshaking TLS
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.2)
+        )
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
         self.last_prices = {}
+        self._stream: Optional[PriceStream] = None
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='crypto-api')
+        # symbol -> (price, time.monotonic() of the batch it came from)
+        self._price_cache: Dict[str, Tuple[float, float]] = {}
+        # (symbol, interval, limit) -> last klines, the base for tail refreshes
+        self._klines: Dict[Tuple[str, str, int], np.ndarray] = {}
+    
+    def start_price_stream(self, symbols: List[str], on_price=None):
+        """
+        Serve prices for symbols from a Binance WebSocket stream instead of REST
+        
+        REST is still used until the stream has delivered a fresh price.
+        
+        Args:
+            symbols: Trading pair symbols to subscribe to
+            on_price: Optional callback invoked as on_price(symbol, price) per update
+        """
+        if self._stream is None:
+            self._stream = PriceStream(symbols, on_price=on_price)
+            self._stream.start()
+    
+    def close(self):
+        """Stop the price stream and release the worker pool and pooled connections"""
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream = None
+        self._pool.shutdown(wait=False)
+        self.session.close()
+    
+    def _is_fresh(self, symbol: str, now: float) -> bool:
+        """Whether the cached price for symbol is younger than CACHE_TTL"""
+        entry = self._price_cache.get(symbol)
+        return entry is not None and now - entry[1] < self.CACHE_TTL
+    
+    def _refresh_all_prices(self):
+        """Fetch every ticker price in one request and replace the cache"""
+        url = f"{self.BASE_URL}/ticker/price"
+        response = self.session.get(url, timeout=10)
+        response.raise_for_status()
+        data = _loads(response.content)
+        
+        now = time.monotonic()
+        self._price_cache = {item['symbol']: (float(item['price']), now) for item in data}
         
     def get_price(self, symbol: str) -> Optional[float]:
         """
@@ -27,13 +138,16 @@ class CryptoAPI:
         Returns:
             Current price or None if error
         """
+        if self._stream is not None:
+            price = self._stream.get_price(symbol)
+            if price is not None:
+                self.last_prices[symbol] = price
+                return price
+        
         try:
-            url = f"{self.BASE_URL}/ticker/price"
-            params = {'symbol': symbol}
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            price = float(data['price'])
+            if not self._is_fresh(symbol, time.monotonic()):
+                self._refresh_all_prices()
+            price = self._price_cache[symbol][0]
             self.last_prices[symbol] = price
             return price
         except Exception as e:
@@ -48,64 +162,117 @@ class CryptoAPI:
             symbols: List of trading pair symbols
             
         Returns:
-            Dictionary mapping symbols to prices
+            Dictionary mapping symbols to prices; a new dict on every call,
+            so callers may keep it without copying
         """
+        if self._stream is not None:
+            prices = self._stream.get_prices(symbols)
+            if prices is not None:
+                self.last_prices.update(prices)
+                return prices
+        
         try:
-            url = f"{self.BASE_URL}/ticker/price"
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            now = time.monotonic()
+            if not all(self._is_fresh(symbol, now) for symbol in symbols):
+                self._refresh_all_prices()
             
             prices = {}
-            for item in data:
-                if item['symbol'] in symbols:
-                    prices[item['symbol']] = float(item['price'])
-                    self.last_prices[item['symbol']] = float(item['price'])
+            for symbol in symbols:
+                entry = self._price_cache.get(symbol)
+                if entry is not None:
+                    prices[symbol] = entry[0]
+            self.last_prices.update(prices)
             
             return prices
         except Exception as e:
             print(f"Error fetching multiple prices: {e}")
             return {}
     
-    def get_klines(self, symbol: str, interval: str = '1h', limit: int = 100) -> List[Dict]:
+    @ttl_cache(ttl=60)
+    def get_klines(self, symbol: str, interval: str = '1h', limit: int = 100) -> np.ndarray:
         """
         Get candlestick/kline data for technical analysis
         
+        After the first full download only the newest KLINE_TAIL candles are
+        refetched and spliced onto the previous result.
+        
         Args:
             symbol: Trading pair symbol
             interval: Kline interval (1m, 5m, 15m, 1h, 4h, 1d, etc.)
             limit: Number of klines to fetch
             
         Returns:
-            List of kline data dictionaries
+            Read-only float64 array of shape (n, 6), columns as in KLINE_COLUMNS
+            (timestamp in ms, open, high, low, close, volume); empty on error
         """
+        key = (symbol, interval, limit)
         try:
-            url = f"{self.BASE_URL}/klines"
-            params = {
-                'symbol': symbol,
-                'interval': interval,
-                'limit': limit
-            }
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            klines = []
-            for k in data:
-                klines.append({
-                    'timestamp': k[0],
-                    'open': float(k[1]),
-                    'high': float(k[2]),
-                    'low': float(k[3]),
-                    'close': float(k[4]),
-                    'volume': float(k[5]),
-                })
+            klines = None
+            previous = self._klines.get(key)
+            if previous is not None:
+                tail = self._fetch_klines(symbol, interval, self.KLINE_TAIL)
+                klines = self._splice_klines(previous, tail, limit)
+            if klines is None:
+                klines = self._fetch_klines(symbol, interval, limit)
             
+            # Shared by every caller within the TTL and the base of the next splice
+            klines.setflags(write=False)
+            self._klines[key] = klines
             return klines
         except Exception as e:
             print(f"Error fetching klines for {symbol}: {e}")
-            return []
+            return np.empty((0, 6))
+    
+    def _fetch_klines(self, symbol: str, interval: str, limit: int) -> np.ndarray:
+        """Download klines as an (n, 6) array; raises on HTTP errors"""
+        url = f"{self.BASE_URL}/klines"
+        params = {
+            'symbol': symbol,
+            'interval': interval,
+            'limit': limit
+        }
+        response = self.session.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        data = _loads(response.content)
+        
+        return np.array([k[:6] for k in data], dtype=np.float64).reshape(-1, 6)
+    
+    @staticmethod
+    def _splice_klines(previous: np.ndarray, tail: np.ndarray, limit: int) -> Optional[np.ndarray]:
+        """
+        Replace the candles of previous from tail's first open time onward
+        
+        Returns:
+            The merged klines (at most limit rows), or None when tail does not
+            overlap previous and a full download is needed
+        """
+        if len(previous) == 0 or len(tail) == 0:
+            return None
+        start = int(np.searchsorted(previous[:, 0], tail[0, 0]))
+        if start == len(previous) or previous[start, 0] != tail[0, 0]:
+            return None
+        return np.concatenate([previous[:start], tail])[-limit:]
+    
+    def get_klines_dicts(self, symbol: str, interval: str = '1h', limit: int = 100) -> List[Dict]:
+        """
+        Get klines as a list of dictionaries (legacy format)
+        
+        Returns:
+            List of kline data dictionaries
+        """
+        return [
+            {
+                'timestamp': int(row[0]),
+                'open': row[1],
+                'high': row[2],
+                'low': row[3],
+                'close': row[4],
+                'volume': row[5],
+            }
+            for row in self.get_klines(symbol, interval, limit).tolist()
+        ]
     
+    @ttl_cache(ttl=60)
     def get_24h_stats(self, symbol: str) -> Optional[Dict]:
         """
         Get 24-hour statistics for a trading pair
@@ -121,7 +288,7 @@ class CryptoAPI:
             params = {'symbol': symbol}
             response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = _loads(response.content)
             
             return {
                 'symbol': data['symbol'],
@@ -135,6 +302,54 @@ class CryptoAPI:
         except Exception as e:
             print(f"Error fetching 24h stats for {symbol}: {e}")
             return None
+    
+    def _fan_out(self, func, symbols: List[str], *args) -> list:
+        """
+        Call func(symbol, *args) for every symbol concurrently, results in order
+        
+        The first symbol runs on the calling thread, which would otherwise
+        just wait on the pool.
+        """
+        if not symbols:
+            return []
+        futures = [self._pool.submit(func, symbol, *args) for symbol in symbols[1:]]
+        first = func(symbols[0], *args)
+        return [first] + [future.result() for future in futures]
+    
+    def get_klines_batch(self, symbols: List[str], interval: str = '1h',
+                         limit: int = 100) -> Dict[str, np.ndarray]:
+        """
+        Fetch klines for several trading pairs concurrently
+        
+        Args:
+            symbols: List of trading pair symbols
+            interval: Kline interval (1m, 5m, 15m, 1h, 4h, 1d, etc.)
+            limit: Number of klines to fetch per symbol
+            
+        Returns:
+            Dictionary mapping symbols to kline arrays (failed symbols are omitted)
+        """
+        results = {}
+        for symbol, klines in zip(symbols, self._fan_out(self.get_klines, symbols, interval, limit)):
+            if len(klines):
+                results[symbol] = klines
+        return results
+    
+    def get_24h_stats_batch(self, symbols: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch 24-hour statistics for several trading pairs concurrently
+        
+        Args:
+            symbols: List of trading pair symbols
+            
+        Returns:
+            Dictionary mapping symbols to 24h statistics (failed symbols are omitted)
+        """
+        results = {}
+        for symbol, stats in zip(symbols, self._fan_out(self.get_24h_stats, symbols)):
+            if stats:
+                results[symbol] = stats
+        return results
 
 
 if __name__ == "__main__":
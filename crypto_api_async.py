@@ -0,0 +1,179 @@
+"""
+Asynchronous cryptocurrency price data fetching module using Binance API
+"""
+
+import asyncio
+import json
+import aiohttp
+import numpy as np
+from typing import Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    orjson = None
+
+
+def _loads(data: bytes):
+    """Parse a JSON response body"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class AsyncCryptoAPI:
+    """Fetches real-time cryptocurrency prices from Binance with aiohttp"""
+    
+    BASE_URL = "https://api.binance.com/api/v3"
+    TIMEOUT = aiohttp.ClientTimeout(total=10)
+    
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.last_prices = {}
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Create the shared session lazily, inside the running event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, keepalive_timeout=75),
+                timeout=self.TIMEOUT
+            )
+        return self._session
+    
+    async def _get_json(self, endpoint: str, params: Dict = None):
+        """GET an endpoint and decode the JSON body"""
+        session = self._get_session()
+        async with session.get(f"{self.BASE_URL}{endpoint}", params=params) as response:
+            response.raise_for_status()
+            return _loads(await response.read())
+    
+    async def close(self):
+        """Close the underlying HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    async def get_price(self, symbol: str) -> Optional[float]:
+        """
+        Get current price for a trading pair
+        
+        Args:
+            symbol: Trading pair symbol (e.g., 'BTCUSDT')
+        
+        Returns:
+            Current price or None if error
+        """
+        try:
+            data = await self._get_json("/ticker/price", {'symbol': symbol})
+            price = float(data['price'])
+            self.last_prices[symbol] = price
+            return price
+        except Exception as e:
+            print(f"Error fetching price for {symbol}: {e}")
+            return None
+    
+    async def get_multiple_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """
+        Get current prices for multiple trading pairs in one request
+        
+        Args:
+            symbols: List of trading pair symbols
+        
+        Returns:
+            Dictionary mapping symbols to prices; a new dict on every call,
+            so callers may keep it without copying
+        """
+        try:
+            data = await self._get_json("/ticker/price")
+            
+            wanted = set(symbols)
+            prices = {}
+            for item in data:
+                if item['symbol'] in wanted:
+                    prices[item['symbol']] = float(item['price'])
+            self.last_prices.update(prices)
+            
+            return prices
+        except Exception as e:
+            print(f"Error fetching multiple prices: {e}")
+            return {}
+    
+    async def get_klines(self, symbol: str, interval: str = '1h', limit: int = 100) -> np.ndarray:
+        """
+        Get candlestick/kline data for technical analysis
+        
+        Args:
+            symbol: Trading pair symbol
+            interval: Kline interval (1m, 5m, 15m, 1h, 4h, 1d, etc.)
+            limit: Number of klines to fetch
+        
+        Returns:
+            float64 array of shape (n, 6): timestamp in ms, open, high, low,
+            close, volume; empty on error
+        """
+        try:
+            params = {
+                'symbol': symbol,
+                'interval': interval,
+                'limit': limit
+            }
+            data = await self._get_json("/klines", params)
+            
+            return np.array([k[:6] for k in data], dtype=np.float64).reshape(-1, 6)
+        except Exception as e:
+            print(f"Error fetching klines for {symbol}: {e}")
+            return np.empty((0, 6))
+    
+    async def get_24h_stats(self, symbol: str) -> Optional[Dict]:
+        """
+        Get 24-hour statistics for a trading pair
+        
+        Args:
+            symbol: Trading pair symbol
+        
+        Returns:
+            Dictionary with 24h statistics
+        """
+        try:
+            data = await self._get_json("/ticker/24hr", {'symbol': symbol})
+            
+            return {
+                'symbol': data['symbol'],
+                'price_change': float(data['priceChange']),
+                'price_change_percent': float(data['priceChangePercent']),
+                'high': float(data['highPrice']),
+                'low': float(data['lowPrice']),
+                'volume': float(data['volume']),
+                'quote_volume': float(data['quoteVolume']),
+            }
+        except Exception as e:
+            print(f"Error fetching 24h stats for {symbol}: {e}")
+            return None
+    
+    async def get_all_klines(self, symbols: List[str], interval: str = '1h',
+                             limit: int = 100) -> Dict[str, np.ndarray]:
+        """
+        Fetch klines for several trading pairs concurrently
+        
+        Returns:
+            Dictionary mapping symbols to kline arrays (failed symbols are omitted)
+        """
+        results = await asyncio.gather(*[self.get_klines(s, interval, limit) for s in symbols])
+        return {symbol: klines for symbol, klines in zip(symbols, results) if len(klines)}
+
+
+if __name__ == "__main__":
+    # Test the API
+    async def _main():
+        api = AsyncCryptoAPI()
+        try:
+            prices = await api.get_multiple_prices(['BTCUSDT', 'ETHUSDT', 'BNBUSDT'])
+            for symbol, price in prices.items():
+                print(f"{symbol}: ${price:,.2f}")
+            
+            klines = await api.get_all_klines(['BTCUSDT', 'ETHUSDT'], interval='15m', limit=10)
+            for symbol, rows in klines.items():
+                print(f"{symbol}: {len(rows)} klines, last close ${rows[-1, 4]:,.2f}")
+        finally:
+            await api.close()
+    
+    asyncio.run(_main())
@@ -0,0 +1,79 @@
+"""
+Fixed-capacity chart history stored as parallel NumPy arrays
+"""
+
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(timestamp: str) -> int:
+    """Naive ISO timestamp -> integer microseconds (exact, unlike float epoch seconds)"""
+    return (datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+
+
+def _to_iso(micros: int) -> str:
+    """Inverse of _to_micros"""
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class HistoryBuffer:
+    """
+    Ring buffer of (timestamp, value) points in an int64 and a float64 array
+    
+    Replaces a deque of {'timestamp': ..., field: ...} dicts: the same points
+    come back as dicts from iteration and to_records(), but storage is two
+    machine words per point instead of a dict, a string and a float each.
+    """
+    
+    def __init__(self, field: str, capacity: int):
+        """
+        Args:
+            field: Key of the value in the point dicts ('value', 'price', ...)
+            capacity: Points kept; older ones are overwritten
+        """
+        self.field = field
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)  # microseconds since 1970, naive
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.appended = 0  # points ever appended, so callers can track what they have seen
+    
+    @classmethod
+    def from_records(cls, records: Iterable[Dict], field: str, capacity: int) -> 'HistoryBuffer':
+        """Buffer holding the newest capacity points of a list of point dicts"""
+        buffer = cls(field, capacity)
+        for record in records:
+            buffer.append(record['timestamp'], record[field])
+        return buffer
+    
+    def append(self, timestamp: str, value: float):
+        """Add a point, overwriting the oldest one when full"""
+        i = self.appended % self.capacity
+        self.timestamps[i] = _to_micros(timestamp)
+        self.values[i] = value
+        self.appended += 1
+    
+    def __len__(self) -> int:
+        return min(self.appended, self.capacity)
+    
+    def _order(self, start: int = 0) -> np.ndarray:
+        """Ring positions of the points appended at index start and later, oldest first"""
+        first = max(start, self.appended - self.capacity)
+        return np.arange(first, self.appended) % self.capacity
+    
+    def records_since(self, start: int) -> List[Dict]:
+        """Point dicts appended at or after the start-th append (overwritten ones are skipped)"""
+        order = self._order(start)
+        field = self.field
+        return [{'timestamp': _to_iso(ts), field: value}
+                for ts, value in zip(self.timestamps[order].tolist(), self.values[order].tolist())]
+    
+    def to_records(self) -> List[Dict]:
+        """All held points as dicts, oldest first"""
+        return self.records_since(0)
+    
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.to_records())
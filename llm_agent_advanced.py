@@ -2,97 +2,416 @@
 Advanced LLM-based trading agent with detailed market data and structured output
 """
 
-import openai
-from typing import Dict, List, Optional
+import asyncio
+import bisect
+import importlib.util
+import time
+import numpy as np
+from typing import Callable, Dict, List, NamedTuple, Optional
 import json
 from datetime import datetime
-from config import DASHSCOPE_API_KEY, LLM_MODEL, LLM_TEMPERATURE
+from price_book import PriceBook, LONG
+from config import (
+    DASHSCOPE_API_KEY, LLM_MODEL, LLM_TEMPERATURE, LLM_MAX_CONCURRENCY, LLM_BATCH_SIZE,
+    LLM_EXPLICIT_CACHE, DECISION_CACHE_TTL, DECISION_CACHE_DIGITS, PROMPT_SERIES_POINTS,
+    VOLATILITY_THRESHOLD, EMERGENCY_THRESHOLD, POSITION_RISK_THRESHOLD,
+    MARKET_VOLATILITY_COINS, COOLDOWN_SECONDS
+)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, fall back to the NumPy scan below
+    njit = None
+
+# httpx only speaks HTTP/2 when the h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+def _loads(data):
+    """Parse JSON text from the model (orjson.JSONDecodeError subclasses json's)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _quantize(values: np.ndarray, digits: int) -> np.ndarray:
+    """Round to `digits` significant digits so near-identical inputs compare equal"""
+    magnitude = np.floor(np.log10(np.abs(values), out=np.zeros_like(values), where=values != 0))
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+class ActionRecord(NamedTuple):
+    """One element of a decision's "actions" array, normalized once"""
+    action: str  # 'open' / 'close' / 'hold', lower-cased
+    symbol: str
+    reason: str
+    position_type: str  # 'long' / 'short', lower-cased ('' when absent)
+    size: float  # 0.0 unless action == 'open'
+    leverage: float  # 1.0 unless action == 'open'
+
+
+def parse_action(data: Dict) -> ActionRecord:
+    """
+    Normalize an LLM action dict: defaults filled in, strings lower-cased, numbers coerced
+    
+    Raises:
+        ValueError/TypeError if an open action's size or leverage is not a number
+    """
+    get = data.get
+    action = get('action', '').lower()
+    if action == 'open':
+        size, leverage = float(get('size', 0)), float(get('leverage', 1))
+    else:
+        size, leverage = 0.0, 1.0
+    return ActionRecord(action, get('symbol', ''), get('reason', ''),
+                        (get('position_type') or '').lower(), size, leverage)
+
+
+# Trigger codes returned by _scan_changes
+SCAN_NONE, SCAN_EMERGENCY, SCAN_MARKET, SCAN_DECAY = 0, 1, 2, 3
+
+
+def _scan_changes_numpy(cur: np.ndarray, last: np.ndarray, emerg: float, vol: float,
+                        decay: float, n_required: int) -> tuple:
+    """
+    Classify price changes in one pass
+    
+    Returns:
+        (trigger_code, offender_idx): SCAN_EMERGENCY with the first mover
+        (in symbol order) above emerg, else SCAN_MARKET if at least n_required moved more than
+        vol, else SCAN_DECAY with the largest mover above decay, else SCAN_NONE
+    """
+    if cur.size == 0:
+        return SCAN_NONE, -1
+    pct = np.abs(cur - last) / last
+    over = pct > emerg
+    if over.any():
+        return SCAN_EMERGENCY, int(over.argmax())
+    top = int(pct.argmax())
+    if np.count_nonzero(pct > vol) >= n_required:
+        return SCAN_MARKET, -1
+    if pct[top] > decay:
+        return SCAN_DECAY, top
+    return SCAN_NONE, -1
+
+
+def _scan_changes_loop(cur, last, emerg, vol, decay, n_required):
+    """Scalar version of _scan_changes_numpy for Numba: exits on the first emergency"""
+    count = 0
+    top = -1
+    top_pct = -1.0
+    for i in range(cur.shape[0]):
+        pct = abs(cur[i] - last[i]) / last[i]
+        if pct > emerg:
+            return SCAN_EMERGENCY, i
+        if pct > vol:
+            count += 1
+        if pct > top_pct:
+            top_pct = pct
+            top = i
+    if count >= n_required:
+        return SCAN_MARKET, -1
+    if top >= 0 and top_pct > decay:
+        return SCAN_DECAY, top
+    return SCAN_NONE, -1
+
+
+if njit is not None:
+    _scan_changes = njit(cache=True)(_scan_changes_loop)
+    # Compile (or load from cache) now rather than on the first live tick
+    _scan_changes(np.ones(1), np.ones(1), 1.0, 1.0, 1.0, 1)
+else:
+    _scan_changes = _scan_changes_numpy
+
+
+# Kept byte-identical across calls so the provider's prefix cache can hit;
+# everything that varies goes into the user message.
+SYSTEM_PROMPT = """You are an AGGRESSIVE cryptocurrency trader with deep knowledge of technical analysis, market dynamics, and leveraged trading.
+
+Your task is to analyze the provided market data and make ACTIVE trading decisions. You should be looking for opportunities to profit from BOTH uptrends and downtrends.
+
+RESPONSE FORMAT:
+You must respond with a JSON object containing THREE sections:
+
+1. "summary": A brief natural language summary of your analysis (1-2 sentences)
+
+2. "chain_of_thought": A structured reasoning process with:
+   - For each coin you're considering, provide:
+     * "signal": "buy_long" | "buy_short" | "hold" | "close"
+     * "confidence": 0.0 to 1.0
+     * "justification": Brief reasoning
+     * "target_price": If opening, your profit target
+     * "stop_loss": If opening, your stop loss level
+     * "leverage": Recommended leverage (5-20)
+     * "risk_usd": Amount willing to risk
+
+3. "actions": Array of concrete actions to take:
+   [{
+     "action": "open" | "close",
+     "symbol": "BTCUSDT",
+     "position_type": "long" | "short",
+     "size": 100.0,
+     "leverage": 10.0,
+     "reason": "Brief reason"
+   }]
+
+TRADING GUIDELINES:
+- BE AGGRESSIVE: Look for opportunities to profit from market movements in BOTH directions
+- LONG positions: Open when trend is bullish (RSI rising, MACD positive, price > EMA-20)
+- SHORT positions: Open when trend is bearish (RSI falling, MACD negative, price < EMA-20)
+- RSI < 30 = oversold (STRONG BUY LONG signal)
+- RSI > 70 = overbought (STRONG SELL SHORT signal)
+- MACD crossing up = buy long, MACD crossing down = buy short
+- Price above EMA-20 = consider long, below EMA-20 = consider short
+- Volume analysis: high volume confirms the move
+
+LEVERAGE STRATEGY:
+- Use 10-15x leverage for moderate conviction trades
+- Use 15-20x leverage for high conviction trades (confidence > 0.8)
+- Minimum leverage should be 5x (we want to maximize returns)
+- Higher leverage = higher profits (but also higher risk, so be selective)
+
+POSITION SIZING:
+- Use 15-25% of available capital per trade
+- Can hold multiple positions across different coins
+- Diversify between long and short positions
+
+RISK MANAGEMENT:
+- Close losing positions if P&L < -8%
+- Take profits when positions gain +12-15%
+- Trail stop losses on profitable trades
+
+ACTIVE TRADING:
+- Don't just hold - actively look for new opportunities
+- If market is choppy, use shorter timeframes
+- When in doubt between long/short, choose based on momentum
+- Empty actions array should be RARE - there's usually an opportunity
+
+IMPORTANT: 
+- You MUST consider BOTH long AND short opportunities for each coin
+- Respond ONLY with valid JSON, no additional text
+- Be decisive and aggressive - we're here to make money!"""
 
 
 class AdvancedTradingAgent:
     """Enhanced LLM-powered trading agent with structured communication"""
     
+    BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    
+    __slots__ = (
+        'api_key', 'client', 'decision_count', 'start_time', 'last_decision',
+        '_http', '_semaphore', '_loop', '_system_prompt', '_system_message', '_symbol_headers',
+        '_start_monotonic', '_decision_cache', '_last_prices_hash',
+        '_cooldown', '_volatility_threshold', '_emergency_threshold',
+        '_position_risk', '_decay_threshold', '_market_coins',
+    )
+    
+    # Prompt section templates, filled with str.format_map on flat dicts
+    _RULE = '=' * 60
+    _HEADER = (
+        "ALL OF THE PRICE OR SIGNAL DATA BELOW IS ORDERED: OLDEST → NEWEST\n\n"
+        "CURRENT MARKET STATE FOR ALL COINS\n"
+    )
+    _SYMBOL_HEADER_TMPL = "\n" + _RULE + "\nALL {coin_name} DATA\n" + _RULE + "\n"
+    _SYMBOL_TMPL = (
+        "current_price = {current_price:.2f}, "
+        "current_ema20 = {ema_20:.3f}, "
+        "current_macd = {macd_value:.3f}, "
+        "current_rsi_7 = {rsi_7:.3f}\n\n"
+    )
+    _SERIES_TMPL = (
+        "Intraday series (recent data, oldest → latest):\n\n"
+        "Prices: {prices}\n\n"
+        "EMA-20: {ema_20}\n\n"
+        "MACD: {macd}\n\n"
+        "RSI (7-period): {rsi_7}\n\n"
+        "RSI (14-period): {rsi_14}\n\n"
+    )
+    _CONTEXT_TMPL = (
+        "Longer-term context:\n"
+        "  20-Period EMA: {ema_20:.3f} vs. 50-Period SMA: {sma_50:.3f}\n"
+        "  Current Volume: {current_volume:.2f} vs. Avg Volume: {avg_volume:.2f}\n"
+        "  Trend: {trend}\n"
+        "  RSI Signal: {rsi_signal}\n"
+        "  Bollinger Bands: {bb_signal}\n\n"
+    )
+    _ACCOUNT_TMPL = (
+        "\n" + _RULE + "\nYOUR ACCOUNT INFORMATION & PERFORMANCE\n" + _RULE + "\n"
+        "Current Total Return: {roi_percent:.2f}%\n\n"
+        "Available Cash: ${current_capital:.2f}\n\n"
+        "Current Account Value: ${total_value:.2f}\n\n"
+    )
+    _POSITION_TMPL = (
+        "  - {symbol}: "
+        "{type_upper} ${size:.2f} @ ${entry_price:.2f}, "
+        "Current: ${current_price:.2f}, "
+        "P&L: ${current_pnl:+.2f} ({pnl_percent:+.2f}%), "
+        "Leverage: {leverage}x\n"
+    )
+    _TOTALS_TMPL = (
+        "\nTotal Trades: {total_trades}\n"
+        "Winning Trades: {winning_trades}\n"
+        "Losing Trades: {losing_trades}\n"
+        "Win Rate: {win_rate:.2f}%\n"
+    )
+    # Volatile fields go last so consecutive prompts share the longest possible prefix
+    _CLOCK_TMPL = (
+        "\nIt has been {elapsed_minutes} minutes since you started trading. "
+        "The current time is {current_time} and you've been invoked {decision_count} times.\n"
+    )
+    
+    _FOOTER_TMPL = (
+        "\n\nMax position size available: ${max_position_size:.2f}\n\n"
+        "Provide your analysis and trading decision in JSON format."
+    )
+    
     def __init__(self, api_key: str = None):
+        # Imported here: openai pulls in httpx, pydantic and anyio, which dominate
+        # import time for modules that only need the prompt helpers
+        import httpx
+        import openai
+        
         self.api_key = api_key or DASHSCOPE_API_KEY
         
-        self.client = openai.OpenAI(
+        # Long-lived keep-alive pool so decisions skip DNS and TLS setup
+        self._http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(30.0, connect=2.0)
+        )
+        self.client = openai.AsyncOpenAI(
             api_key=self.api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+            base_url=self.BASE_URL,
+            http_client=self._http
         )
+        # Caps in-flight LLM requests when several decisions run concurrently
+        self._semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        # The async client's connection pool is bound to the loop it first ran on,
+        # so the sync wrapper reuses one loop instead of asyncio.run() per call
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._warm_up())
         
+        self._system_prompt = SYSTEM_PROMPT
+        if LLM_EXPLICIT_CACHE:
+            # DashScope explicit context cache: mark the static prefix as cacheable
+            self._system_message = {"role": "system", "content": [{
+                "type": "text",
+                "text": self._system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }]}
+        else:
+            self._system_message = {"role": "system", "content": self._system_prompt}
+        # Per-symbol section banners, formatted on first use
+        self._symbol_headers: Dict[str, str] = {}
         self.decision_count = 0
         self.start_time = datetime.now()
+        self._start_monotonic = time.monotonic()  # elapsed time, immune to clock changes
         self.last_decision = None
-        
+        # Decisions keyed by market fingerprint -> (monotonic time, decision)
+        self._decision_cache: Dict[int, tuple] = {}
+        # Hash of the last (current, reference) price pair that passed the volatility checks
+        self._last_prices_hash = None
+        # Wake-up thresholds, bound once so the per-tick checks skip global lookups
+        self._cooldown = float(COOLDOWN_SECONDS)
+        self._volatility_threshold = float(VOLATILITY_THRESHOLD)
+        self._emergency_threshold = float(EMERGENCY_THRESHOLD)
+        self._position_risk = float(POSITION_RISK_THRESHOLD)
+        self._decay_threshold = self._volatility_threshold * 0.75  # Lower to 1.5%
+        self._market_coins = int(MARKET_VOLATILITY_COINS)
+    
     def create_detailed_market_prompt(self, current_prices: Dict, technical_analysis: Dict,
                                      portfolio_stats: Dict, open_positions: List) -> str:
         """Create detailed market data prompt similar to the reference format"""
         
-        elapsed_minutes = int((datetime.now() - self.start_time).total_seconds() / 60)
+        elapsed_minutes = int((time.monotonic() - self._start_monotonic) / 60)
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        prompt = f"""It has been {elapsed_minutes} minutes since you started trading. The current time is {current_time} and you've been invoked {self.decision_count} times.
-
-ALL OF THE PRICE OR SIGNAL DATA BELOW IS ORDERED: OLDEST → NEWEST
-
-CURRENT MARKET STATE FOR ALL COINS
-"""
+        parts = [self._HEADER]
         
         # Add data for each coin
         for symbol in sorted(technical_analysis.keys()):
             analysis = technical_analysis[symbol]
             series = analysis.get('series', {})
             
-            coin_name = symbol.replace('USDT', '')
-            prompt += f"\n{'='*60}\nALL {coin_name} DATA\n{'='*60}\n"
-            prompt += f"current_price = {analysis['current_price']:.2f}, "
-            prompt += f"current_ema20 = {analysis['ema_20']:.3f}, "
-            prompt += f"current_macd = {analysis['macd']['macd']:.3f}, "
-            prompt += f"current_rsi_7 = {analysis['rsi_7']:.3f}\n\n"
+            header = self._symbol_headers.get(symbol)
+            if header is None:
+                header = self._symbol_headers[symbol] = self._SYMBOL_HEADER_TMPL.format(
+                    coin_name=symbol.replace('USDT', ''))
+            parts.append(header)
+            parts.append(self._SYMBOL_TMPL.format_map({
+                **analysis,
+                'macd_value': analysis['macd']['macd'],
+            }))
             
             # Intraday series
             if series.get('prices'):
-                prompt += "Intraday series (recent data, oldest → latest):\n\n"
-                prompt += f"Prices: {[round(p, 2) for p in series['prices']]}\n\n"
-                prompt += f"EMA-20: {[round(e, 3) for e in series['ema_20']]}\n\n"
-                prompt += f"MACD: {[round(m, 3) for m in series['macd']]}\n\n"
-                prompt += f"RSI (7-period): {[round(r, 3) for r in series['rsi_7']]}\n\n"
-                prompt += f"RSI (14-period): {[round(r, 3) for r in series['rsi_14']]}\n\n"
+                # Keep the latest PROMPT_SERIES_POINTS and round the indicator rows in one
+                # vectorized call; prices keep 2 decimals
+                indicators = np.round(np.array([series['ema_20'], series['macd'],
+                                                series['rsi_7'], series['rsi_14']],
+                                               dtype=np.float64)[:, -PROMPT_SERIES_POINTS:], 3).tolist()
+                prices = np.asarray(series['prices'], dtype=np.float64)[-PROMPT_SERIES_POINTS:]
+                parts.append(self._SERIES_TMPL.format_map({
+                    'prices': np.round(prices, 2).tolist(),
+                    'ema_20': indicators[0],
+                    'macd': indicators[1],
+                    'rsi_7': indicators[2],
+                    'rsi_14': indicators[3],
+                }))
             
             # Longer-term context
-            prompt += "Longer-term context:\n"
-            prompt += f"  20-Period EMA: {analysis['ema_20']:.3f} vs. 50-Period SMA: {analysis['sma_50']:.3f}\n"
-            prompt += f"  Current Volume: {analysis['current_volume']:.2f} vs. Avg Volume: {analysis['avg_volume']:.2f}\n"
-            prompt += f"  Trend: {analysis['trend']}\n"
-            prompt += f"  RSI Signal: {analysis['rsi_signal']}\n"
-            prompt += f"  Bollinger Bands: {analysis['bb_signal']}\n\n"
+            parts.append(self._CONTEXT_TMPL.format_map(analysis))
         
         # Account information
-        prompt += f"\n{'='*60}\nYOUR ACCOUNT INFORMATION & PERFORMANCE\n{'='*60}\n"
-        prompt += f"Current Total Return: {portfolio_stats['roi_percent']:.2f}%\n\n"
-        prompt += f"Available Cash: ${portfolio_stats['current_capital']:.2f}\n\n"
-        prompt += f"Current Account Value: ${portfolio_stats['total_value']:.2f}\n\n"
+        parts.append(self._ACCOUNT_TMPL.format_map(portfolio_stats))
         
         if open_positions:
-            prompt += "Current live positions & performance:\n"
-            for pos in open_positions:
-                prompt += f"  - {pos['symbol']}: "
-                prompt += f"{pos['type'].upper()} ${pos['size']:.2f} @ ${pos['entry_price']:.2f}, "
-                prompt += f"Current: ${pos['current_price']:.2f}, "
-                prompt += f"P&L: ${pos['current_pnl']:+.2f} ({pos['pnl_percent']:+.2f}%), "
-                prompt += f"Leverage: {pos['leverage']}x\n"
+            parts.append("Current live positions & performance:\n")
+            parts.extend(self._POSITION_TMPL.format_map({**pos, 'type_upper': pos['type'].upper()})
+                         for pos in open_positions)
         else:
-            prompt += "Current live positions: None\n"
+            parts.append("Current live positions: None\n")
         
-        prompt += f"\nTotal Trades: {portfolio_stats['total_trades']}\n"
-        prompt += f"Winning Trades: {portfolio_stats['winning_trades']}\n"
-        prompt += f"Losing Trades: {portfolio_stats['losing_trades']}\n"
-        prompt += f"Win Rate: {portfolio_stats['win_rate']:.2f}%\n"
+        parts.append(self._TOTALS_TMPL.format_map(portfolio_stats))
+        parts.append(self._CLOCK_TMPL.format_map({
+            'elapsed_minutes': elapsed_minutes,
+            'current_time': current_time,
+            'decision_count': self.decision_count,
+        }))
         
-        return prompt
+        return ''.join(parts)
+    
+    async def _warm_up(self):
+        """Open a pooled connection to the API host ahead of the first decision"""
+        import httpx
+        
+        try:
+            await self._http.head(self.BASE_URL)
+        except httpx.HTTPError as e:
+            print(f"⚠️  LLM connection warm-up failed: {e}")
+    
+    def _messages(self, user_prompt: str) -> List[Dict]:
+        """Chat messages: the fixed system prompt followed by the per-call user prompt"""
+        return [self._system_message, {"role": "user", "content": user_prompt}]
     
     def make_decision(self, current_prices: Dict, open_positions: List, 
-                     account_balance: float, market_data: Dict) -> Dict:
+                     account_balance: float, market_data: Dict,
+                     on_partial: Optional[Callable[[str, object], None]] = None) -> Dict:
+        """Blocking wrapper around make_decision_async for synchronous callers"""
+        return self._loop.run_until_complete(
+            self.make_decision_async(current_prices, open_positions, account_balance, market_data,
+                                     on_partial)
+        )
+    
+    async def make_decision_async(self, current_prices: Dict, open_positions: List,
+                                  account_balance: float, market_data: Dict,
+                                  on_partial: Optional[Callable[[str, object], None]] = None) -> Dict:
         """
         Make trading decision with structured output
         
@@ -101,6 +420,8 @@ CURRENT MARKET STATE FOR ALL COINS
             open_positions: List of current open positions
             account_balance: Available cash balance
             market_data: Technical analysis data for all pairs
+            on_partial: Optional callback receiving ('summary', str) and then
+                        ('action', dict) per action while the response streams
         
         Returns:
             {
@@ -109,6 +430,11 @@ CURRENT MARKET STATE FOR ALL COINS
                 'actions': [...]
             }
         """
+        fingerprint = self._fingerprint(market_data, open_positions, account_balance)
+        cached = self._cached_decision(fingerprint)
+        if cached is not None:
+            return cached
+        
         self.decision_count += 1
         
         # Build portfolio stats for prompt
@@ -133,94 +459,21 @@ CURRENT MARKET STATE FOR ALL COINS
             open_positions=open_positions
         )
         
-        system_prompt = """You are an AGGRESSIVE cryptocurrency trader with deep knowledge of technical analysis, market dynamics, and leveraged trading.
-
-Your task is to analyze the provided market data and make ACTIVE trading decisions. You should be looking for opportunities to profit from BOTH uptrends and downtrends.
-
-RESPONSE FORMAT:
-You must respond with a JSON object containing THREE sections:
-
-1. "summary": A brief natural language summary of your analysis (1-2 sentences)
-
-2. "chain_of_thought": A structured reasoning process with:
-   - For each coin you're considering, provide:
-     * "signal": "buy_long" | "buy_short" | "hold" | "close"
-     * "confidence": 0.0 to 1.0
-     * "justification": Brief reasoning
-     * "target_price": If opening, your profit target
-     * "stop_loss": If opening, your stop loss level
-     * "leverage": Recommended leverage (5-20)
-     * "risk_usd": Amount willing to risk
-
-3. "actions": Array of concrete actions to take:
-   [{
-     "action": "open" | "close",
-     "symbol": "BTCUSDT",
-     "position_type": "long" | "short",
-     "size": 100.0,
-     "leverage": 10.0,
-     "reason": "Brief reason"
-   }]
-
-TRADING GUIDELINES:
-- BE AGGRESSIVE: Look for opportunities to profit from market movements in BOTH directions
-- LONG positions: Open when trend is bullish (RSI rising, MACD positive, price > EMA-20)
-- SHORT positions: Open when trend is bearish (RSI falling, MACD negative, price < EMA-20)
-- RSI < 30 = oversold (STRONG BUY LONG signal)
-- RSI > 70 = overbought (STRONG SELL SHORT signal)
-- MACD crossing up = buy long, MACD crossing down = buy short
-- Price above EMA-20 = consider long, below EMA-20 = consider short
-- Volume analysis: high volume confirms the move
-
-LEVERAGE STRATEGY:
-- Use 10-15x leverage for moderate conviction trades
-- Use 15-20x leverage for high conviction trades (confidence > 0.8)
-- Minimum leverage should be 5x (we want to maximize returns)
-- Higher leverage = higher profits (but also higher risk, so be selective)
-
-POSITION SIZING:
-- Use 15-25% of available capital per trade
-- Can hold multiple positions across different coins
-- Diversify between long and short positions
-
-RISK MANAGEMENT:
-- Close losing positions if P&L < -8%
-- Take profits when positions gain +12-15%
-- Trail stop losses on profitable trades
-
-ACTIVE TRADING:
-- Don't just hold - actively look for new opportunities
-- If market is choppy, use shorter timeframes
-- When in doubt between long/short, choose based on momentum
-- Empty actions array should be RARE - there's usually an opportunity
-
-IMPORTANT: 
-- You MUST consider BOTH long AND short opportunities for each coin
-- Respond ONLY with valid JSON, no additional text
-- Be decisive and aggressive - we're here to make money!"""
-
-        user_prompt = market_prompt + f"\n\nMax position size available: ${max_position_size:.2f}\n\nProvide your analysis and trading decision in JSON format."
+        user_prompt = market_prompt + self._FOOTER_TMPL.format(max_position_size=max_position_size)
         
         try:
-            response = self.client.chat.completions.create(
-                model=LLM_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=LLM_TEMPERATURE,
-                max_tokens=2000
-            )
+            async with self._semaphore:
+                response = await self.client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=self._messages(user_prompt),
+                    temperature=LLM_TEMPERATURE,
+                    max_tokens=2000,
+                    response_format={"type": "json_object"},
+                    stream=True
+                )
+                content = await self._read_json_object(response, on_partial)
             
-            content = response.choices[0].message.content.strip()
-            
-            # Extract JSON
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            decision = json.loads(content)
+            decision = _loads(content)
             
             # Validate structure
             if not isinstance(decision, dict):
@@ -239,9 +492,10 @@ IMPORTANT:
                 'decision': decision,
                 'prompt': market_prompt
             }
+            self._store_decision(fingerprint, decision)
             
             return decision
-            
+        
         except json.JSONDecodeError as e:
             print(f"Error parsing LLM response as JSON: {e}")
             return {
@@ -259,21 +513,229 @@ IMPORTANT:
                 'user_prompt': market_prompt if 'market_prompt' in locals() else ''
             }
     
-    def should_request_decision(self, current_prices: Dict, last_prices: Dict,
+    def _fingerprint(self, market_data: Dict, open_positions: List, account_balance: float) -> int:
+        """Hash of the quantized market features, open positions and balance"""
+        symbols = sorted(market_data)
+        features = np.array([
+            (a.get('current_price', 0.0), a.get('ema_20', 0.0),
+             a.get('macd', {}).get('macd', 0.0), a.get('rsi_7', 0.0))
+            for a in (market_data[s] for s in symbols)
+        ], dtype=np.float64).reshape(-1, 4)
+        positions = tuple(sorted((p['symbol'], p['type'], p['size'], p.get('leverage', 1))
+                                 for p in open_positions))
+        return hash((tuple(symbols), _quantize(features, DECISION_CACHE_DIGITS).tobytes(),
+                     positions, round(account_balance, 2)))
+    
+    def _cached_decision(self, fingerprint: int) -> Optional[Dict]:
+        """
+        Hold decision for a fingerprint already decided within DECISION_CACHE_TTL, if any
+        
+        The stored actions are not returned: an unchanged fingerprint means they
+        had no effect (e.g. a rejected open), so replaying them would only resend
+        the same orders every tick.
+        """
+        entry = self._decision_cache.get(fingerprint)
+        if entry is None or time.monotonic() - entry[0] > DECISION_CACHE_TTL:
+            return None
+        decision = entry[1]
+        return {
+            'summary': f"(cached) {decision['summary']}",
+            'chain_of_thought': decision.get('chain_of_thought', {}),
+            'actions': [],
+            'cached': True
+        }
+    
+    def _store_decision(self, fingerprint: int, decision: Dict):
+        """Remember a decision, dropping expired entries"""
+        now = time.monotonic()
+        self._decision_cache = {k: v for k, v in self._decision_cache.items()
+                                if now - v[0] <= DECISION_CACHE_TTL}
+        self._decision_cache[fingerprint] = (now, decision)
+    
+    def make_decisions_batched(self, prompts: List[str]) -> List[Dict]:
+        """Blocking wrapper around make_decisions_batched_async"""
+        return self._loop.run_until_complete(self.make_decisions_batched_async(prompts))
+    
+    async def make_decisions_batched_async(self, prompts: List[str]) -> List[Dict]:
+        """
+        Get decisions for several independent prompts with fewer LLM requests
+        
+        Prompts are packed LLM_BATCH_SIZE at a time into one request (batches
+        run concurrently) and the model answers each with a decision in the
+        same format as make_decision.
+        
+        Args:
+            prompts: Market prompts, e.g. one per symbol
+        
+        Returns:
+            One decision dictionary per prompt, in input order
+        """
+        batches = [prompts[i:i + LLM_BATCH_SIZE] for i in range(0, len(prompts), LLM_BATCH_SIZE)]
+        results = await asyncio.gather(*[self._request_batch(batch) for batch in batches])
+        return [decision for batch in results for decision in batch]
+    
+    async def _request_batch(self, prompts: List[str]) -> List[Dict]:
+        """Send one packed request and fan the answers back out per prompt"""
+        self.decision_count += 1
+        
+        # Batch instructions go in the user message so the system prompt stays cacheable
+        parts = [f"You are given {len(prompts)} independent requests. Answer each one separately.\n"]
+        for i, prompt in enumerate(prompts):
+            parts.append(f"\n{self._RULE}\nREQUEST {i}\n{self._RULE}\n{prompt}\n")
+        parts.append(
+            f'\nRespond with a JSON object {{"decisions": [...]}} containing exactly {len(prompts)} '
+            'decision objects in request order, each with "request" (its index), "summary", '
+            '"chain_of_thought" and "actions".'
+        )
+        
+        try:
+            async with self._semaphore:
+                response = await self.client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=self._messages(''.join(parts)),
+                    temperature=LLM_TEMPERATURE,
+                    max_tokens=2000,
+                    response_format={"type": "json_object"},
+                    stream=True
+                )
+                content = await self._read_json_object(response)
+            
+            answers = _loads(content).get('decisions', [])
+            by_index = {}
+            for position, answer in enumerate(answers):
+                if isinstance(answer, dict):
+                    by_index.setdefault(answer.get('request', position), answer)
+            error = None
+        except Exception as e:
+            print(f"Error getting batched LLM decision: {e}")
+            by_index = {}
+            error = f'Error: {str(e)}'
+        
+        decisions = []
+        for i, prompt in enumerate(prompts):
+            decision = by_index.get(i)
+            if decision is None:
+                decision = {'summary': error or 'Error: No decision returned for this request'}
+            decision.setdefault('summary', 'No summary provided')
+            decision.setdefault('chain_of_thought', {})
+            decision.setdefault('actions', [])
+            decision['user_prompt'] = prompt
+            decisions.append(decision)
+        return decisions
+    
+    @staticmethod
+    async def _read_json_object(stream, on_partial: Optional[Callable[[str, object], None]] = None) -> str:
+        """
+        Accumulate a streamed completion until its top-level JSON object closes
+        
+        Tracks brace depth (ignoring braces inside strings) and closes the
+        stream as soon as the object is complete, so trailing tokens are not
+        waited for. If on_partial is given it is called as
+        on_partial('summary', text) and on_partial('action', dict) as soon as
+        the top-level "summary" and each element of "actions" are complete.
+        """
+        buffer = []
+        starts = []  # offset of each buffer chunk in the stream
+        consumed = 0  # characters already in buffer
+        depth = 0
+        in_string = False
+        escaped = False
+        
+        # Top-level key tracking for on_partial (absolute character offsets)
+        string_span = None
+        current_key = None
+        expect_value = False
+        in_actions = False
+        action_start = 0
+        
+        def span(start, end, text):
+            # Join only the chunks from the one holding start, so each emit costs
+            # the length of its span rather than of everything received so far
+            if start >= consumed:
+                return text[start - consumed:end - consumed]
+            first = bisect.bisect_right(starts, start) - 1
+            offset = starts[first]
+            return (''.join(buffer[first:]) + text)[start - offset:end - offset]
+        
+        def emit(field, start, end, text):
+            # A fragment that fails to parse is skipped; the whole object is parsed afterwards
+            try:
+                on_partial(field, _loads(span(start, end, text)))
+            except Exception:
+                pass
+        
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                
+                for i, ch in enumerate(text):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif ch == '\\':
+                            escaped = True
+                        elif ch == '"':
+                            in_string = False
+                            if on_partial is not None and depth == 1:
+                                string_span = (string_span[0], consumed + i + 1)
+                                if expect_value and current_key == 'summary':
+                                    emit('summary', *string_span, text)
+                    elif ch == '"':
+                        in_string = depth > 0
+                        string_span = (consumed + i, None)
+                    elif ch == '{':
+                        depth += 1
+                        if in_actions and depth == 2:
+                            action_start = consumed + i
+                    elif ch == '}' and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            buffer.append(text[:i + 1])
+                            content = ''.join(buffer)
+                            return content[content.find('{'):]
+                        if in_actions and depth == 1 and on_partial is not None:
+                            emit('action', action_start, consumed + i + 1, text)
+                    elif depth == 1 and on_partial is not None:
+                        if ch == ':' and string_span is not None:
+                            current_key = span(string_span[0] + 1, string_span[1] - 1, text)
+                            expect_value = True
+                        elif ch == ',':
+                            expect_value = False
+                        elif ch == '[' and expect_value and current_key == 'actions':
+                            in_actions = True
+                        elif ch == ']':
+                            in_actions = False
+                buffer.append(text)
+                starts.append(consumed)
+                consumed += len(text)
+        finally:
+            await stream.close()
+        
+        return ''.join(buffer)
+    
+    def should_request_decision(self, current: PriceBook, last: Optional[PriceBook],
                                time_since_last: float, decision_interval: float,
-                               open_positions: List = None) -> tuple:
+                               positions: Optional[np.recarray] = None) -> tuple:
         """
         Multi-level intelligent wake-up mechanism
         
+        Args:
+            current: This iteration's prices
+            last: Prices at the previous iteration (same symbol list), or None
+            time_since_last: Seconds since the last LLM decision
+            decision_interval: Seconds between scheduled decisions
+            positions: Open positions as a price_book.positions_array
+        
         Returns:
             (should_decide: bool, reason: str)
         """
-        from config import (VOLATILITY_THRESHOLD, EMERGENCY_THRESHOLD, 
-                          POSITION_RISK_THRESHOLD, MARKET_VOLATILITY_COINS, COOLDOWN_SECONDS)
-        
         # ===== Level 0: Cooldown check =====
         # Prevent too frequent LLM calls
-        if time_since_last < COOLDOWN_SECONDS:
+        if time_since_last < self._cooldown:
             return False, "cooldown_active"
         
         # ===== Level 1: Scheduled trigger (lowest priority) =====
@@ -281,67 +743,78 @@ IMPORTANT:
             return True, "scheduled_interval"
         
         # ===== Level 2: Market volatility triggers =====
-        if not last_prices:
+        if last is None or last.is_empty():
             return True, "first_run"
         
-        # 2a. Single coin emergency volatility (>5%)
-        for symbol, current_price in current_prices.items():
-            if symbol in last_prices:
-                change_pct = abs(current_price - last_prices[symbol]) / last_prices[symbol]
-                if change_pct > EMERGENCY_THRESHOLD:
-                    return True, f"emergency_volatility_{symbol}_{change_pct:.1%}"
-        
-        # 2b. Market-wide volatility (multiple coins >2% volatility)
-        volatile_coins = []
-        for symbol, current_price in current_prices.items():
-            if symbol in last_prices:
-                change_pct = abs(current_price - last_prices[symbol]) / last_prices[symbol]
-                if change_pct > VOLATILITY_THRESHOLD:
-                    volatile_coins.append((symbol, change_pct))
-        
-        if len(volatile_coins) >= MARKET_VOLATILITY_COINS:
-            coins_str = ', '.join([f"{s}:{c:.1%}" for s, c in volatile_coins[:3]])
-            return True, f"market_volatility_{len(volatile_coins)}_coins_({coins_str})"
+        cur, prev = current.prices, last.prices
+        # A symbol missing from either side counts as unchanged
+        missing = np.isnan(cur) | np.isnan(prev)
+        if missing.any():
+            cur = np.where(missing, 1.0, cur)
+            prev = np.where(missing, 1.0, prev)
+        symbols = current.symbols
+        
+        # Level 4 threshold, only once enough of the interval has passed
+        if time_since_last > decision_interval * 0.6:  # After 60% of interval
+            decay_threshold = self._decay_threshold
+        else:
+            decay_threshold = np.inf
+        
+        # Same prices against the same reference as a snapshot that already passed 2a/2b
+        prices_hash = hash((cur.tobytes(), prev.tobytes()))
+        if prices_hash != self._last_prices_hash:
+            code, idx = _scan_changes(cur, prev, self._emergency_threshold, self._volatility_threshold,
+                                      decay_threshold, self._market_coins)
+            
+            # 2a. Single coin emergency volatility (>5%)
+            if code == SCAN_EMERGENCY:
+                change_pct = abs(cur[idx] - prev[idx]) / prev[idx]
+                return True, f"emergency_volatility_{symbols[idx]}_{change_pct:.1%}"
+            
+            # 2b. Market-wide volatility (multiple coins >2% volatility)
+            if code == SCAN_MARKET:
+                pct = np.abs(cur - prev) / prev
+                volatile = np.flatnonzero(pct > self._volatility_threshold)
+                coins_str = ', '.join(f"{symbols[i]}:{pct[i]:.1%}" for i in volatile[:3])
+                return True, f"market_volatility_{len(volatile)}_coins_({coins_str})"
+            
+            self._last_prices_hash = prices_hash
+        elif decay_threshold == np.inf:
+            # Nothing in the scan can fire: skip it
+            code, idx = SCAN_NONE, -1
+        else:
+            # Only the decay check can still fire
+            code, idx = _scan_changes(cur, prev, np.inf, np.inf, decay_threshold, len(cur) + 1)
         
         # ===== Level 3: Position risk triggers (highest priority) =====
-        if open_positions:
-            for pos in open_positions:
-                symbol = pos['symbol']
-                if symbol not in current_prices or symbol not in last_prices:
-                    continue
-                
-                current_price = current_prices[symbol]
-                last_price = last_prices[symbol]
-                change_pct = (current_price - last_price) / last_price
-                
-                # Check if price hit LLM-defined targets
-                if 'target_price' in pos and pos['target_price']:
-                    if pos['type'] == 'long' and current_price >= pos['target_price']:
-                        return True, f"target_reached_{symbol}_${current_price:.2f}"
-                    elif pos['type'] == 'short' and current_price <= pos['target_price']:
-                        return True, f"target_reached_{symbol}_${current_price:.2f}"
-                
-                if 'stop_loss' in pos and pos['stop_loss']:
-                    if pos['type'] == 'long' and current_price <= pos['stop_loss']:
-                        return True, f"stop_loss_hit_{symbol}_${current_price:.2f}"
-                    elif pos['type'] == 'short' and current_price >= pos['stop_loss']:
-                        return True, f"stop_loss_hit_{symbol}_${current_price:.2f}"
-                
-                # Position risk: price moving against position
-                if pos['type'] == 'long' and change_pct < -POSITION_RISK_THRESHOLD:
-                    return True, f"position_risk_long_{symbol}_{change_pct:.1%}"
-                elif pos['type'] == 'short' and change_pct > POSITION_RISK_THRESHOLD:
-                    return True, f"position_risk_short_{symbol}_{change_pct:.1%}"
+        if positions is not None and len(positions):
+            pos_cur = current.prices[positions.symbol_idx]
+            pos_last = last.prices[positions.symbol_idx]
+            change = (pos_cur - pos_last) / pos_last
+            is_long = positions.type == LONG
+            
+            # Price hit LLM-defined targets / stops (NaN targets and prices never match)
+            target_hit = np.where(is_long, pos_cur >= positions.target, pos_cur <= positions.target)
+            stop_hit = np.where(is_long, pos_cur <= positions.stop, pos_cur >= positions.stop)
+            # Position risk: price moving against position
+            at_risk = np.where(is_long, change < -self._position_risk, change > self._position_risk)
+            
+            hit = np.flatnonzero(target_hit | stop_hit | at_risk)
+            if hit.size:
+                i = hit[0]
+                symbol = symbols[positions.symbol_idx[i]]
+                if target_hit[i]:
+                    return True, f"target_reached_{symbol}_${pos_cur[i]:.2f}"
+                if stop_hit[i]:
+                    return True, f"stop_loss_hit_{symbol}_${pos_cur[i]:.2f}"
+                side = 'long' if is_long[i] else 'short'
+                return True, f"position_risk_{side}_{symbol}_{change[i]:.1%}"
         
         # ===== Level 4: Time decay trigger =====
         # Lower threshold if significant time passed
-        if time_since_last > decision_interval * 0.6:  # After 60% of interval
-            decay_threshold = VOLATILITY_THRESHOLD * 0.75  # Lower to 1.5%
-            for symbol, current_price in current_prices.items():
-                if symbol in last_prices:
-                    change_pct = abs(current_price - last_prices[symbol]) / last_prices[symbol]
-                    if change_pct > decay_threshold:
-                        return True, f"decay_trigger_{symbol}_{change_pct:.1%}"
+        if code == SCAN_DECAY:
+            change_pct = abs(cur[idx] - prev[idx]) / prev[idx]
+            return True, f"decay_trigger_{symbols[idx]}_{change_pct:.1%}"
         
         return False, "no_trigger"
 
@@ -379,7 +852,7 @@ Available Cash: $1000.00
 Current Account Value: $1000.00
 Current live positions: None
 """
-        
+
         decision = agent.make_decision(mock_prompt, 200)
         print(json.dumps(decision, indent=2))
 
@@ -2,17 +2,40 @@
 Logging and statistics tracking module
 """
 
+import atexit
 import json
 import csv
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
 from datetime import datetime
 from typing import Dict, List
 import os
 
+from config import LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+
+def _dumps_line(record: Dict) -> bytes:
+    """Serialize one record as a compact JSON line"""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
 
 class TradingLogger:
     """Logs trading activities and statistics"""
     
-    def __init__(self, log_dir: str = "logs"):
+    BUFFER_SIZE = 1 << 16  # per-file write buffer; written out on flush() or when full
+    LOG_BUFFER_RECORDS = 1000  # general log records held until flush() (ERROR and above go out at once)
+    
+    def __init__(self, log_dir: str = "logs", level: str = LOG_LEVEL):
         self.log_dir = log_dir
         self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
         
@@ -22,11 +45,31 @@ class TradingLogger:
         # Log files
         self.general_log = os.path.join(log_dir, f"trading_{self.session_id}.log")
         self.trades_log = os.path.join(log_dir, f"trades_{self.session_id}.csv")
-        self.stats_log = os.path.join(log_dir, f"stats_{self.session_id}.json")
-        self.decisions_log = os.path.join(log_dir, f"decisions_{self.session_id}.json")
+        self.stats_log = os.path.join(log_dir, f"stats_{self.session_id}.jsonl")
+        self.decisions_log = os.path.join(log_dir, f"decisions_{self.session_id}.jsonl")
+        
+        # Background writer: public methods only enqueue, the thread owns the files
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._drain, name='trading-logger', daemon=True)
+        self._closed = False
+        
+        # General log: a logging.Logger that prints to the console and queues each
+        # record for the writer thread, which buffers it and writes it to a
+        # RotatingFileHandler. Messages below the level are dropped before formatting.
+        self._logger = logging.getLogger(f"{__name__}.{self.session_id}")
+        self._logger.propagate = False
+        self._logger.handlers.clear()
+        try:
+            self._logger.setLevel(level)
+        except (TypeError, ValueError):
+            self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(logging.StreamHandler(sys.stdout))
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
         
         # Initialize files
         self._init_logs()
+        self._writer.start()
+        atexit.register(self.close)
         
         # In-memory stats
         self.stats_history = []
@@ -34,51 +77,64 @@ class TradingLogger:
     
     def _init_logs(self):
         """Initialize log files"""
-        # General log
-        self.log("=== Trading Session Started ===")
+        # Handles kept open for the session and used only by the writer thread
+        self._files = {
+            'trade': open(self.trades_log, 'w', newline='', buffering=self.BUFFER_SIZE),
+            'stats': open(self.stats_log, 'ab', buffering=self.BUFFER_SIZE),
+            'decision': open(self.decisions_log, 'ab', buffering=self.BUFFER_SIZE),
+        }
+        self._log_file = logging.handlers.RotatingFileHandler(
+            self.general_log, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        self._log_file.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S"))
+        self._log_handler = logging.handlers.MemoryHandler(
+            self.LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=self._log_file)
         
         # Trades CSV
-        with open(self.trades_log, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                'timestamp', 'action', 'symbol', 'type', 'size', 
-                'entry_price', 'exit_price', 'leverage', 'pnl'
-            ])
-    
-    def log(self, message: str):
-        """Write message to general log"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"[{timestamp}] {message}\n"
+        self._trade_writer = csv.writer(self._files['trade'])
+        self._queue.put(('trade', [
+            'timestamp', 'action', 'symbol', 'type', 'size', 
+            'entry_price', 'exit_price', 'leverage', 'pnl'
+        ]))
         
-        with open(self.general_log, 'a', encoding='utf-8') as f:
-            f.write(log_message)
+        # General log
+        self.log("=== Trading Session Started ===")
+    
+    def log(self, message: str, *args, level: int = logging.INFO):
+        """
+        Write message to general log
         
-        print(message)
+        With args, message is %-formatted only if level is enabled, so callers
+        can pass values instead of building the string up front.
+        """
+        self._logger.log(level, message, *args)
+    
+    def debug(self, message: str, *args):
+        """log() at DEBUG level"""
+        self.log(message, *args, level=logging.DEBUG)
+    
+    def is_enabled_for(self, level: int) -> bool:
+        """Whether messages at level would be written"""
+        return self._logger.isEnabledFor(level)
     
     def log_trade(self, trade: Dict):
         """Log a trade to CSV"""
-        with open(self.trades_log, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                trade.get('timestamp', ''),
-                trade.get('action', ''),
-                trade.get('symbol', ''),
-                trade.get('type', ''),
-                trade.get('size', 0),
-                trade.get('entry_price', 0),
-                trade.get('exit_price', 0),
-                trade.get('leverage', 1),
-                trade.get('pnl', 0)
-            ])
+        self._queue.put(('trade', [
+            trade.get('timestamp', ''),
+            trade.get('action', ''),
+            trade.get('symbol', ''),
+            trade.get('type', ''),
+            trade.get('size', 0),
+            trade.get('entry_price', 0),
+            trade.get('exit_price', 0),
+            trade.get('leverage', 1),
+            trade.get('pnl', 0)
+        ]))
     
     def log_statistics(self, stats: Dict):
         """Log portfolio statistics"""
         stats['timestamp'] = datetime.now().isoformat()
         self.stats_history.append(stats)
-        
-        # Write all stats history to file
-        with open(self.stats_log, 'w', encoding='utf-8') as f:
-            json.dump(self.stats_history, f, indent=2)
+        self._queue.put(('stats', stats))
     
     def log_decision(self, decision: Dict, market_summary: str):
         """Log LLM decision"""
@@ -88,10 +144,51 @@ class TradingLogger:
             'market_summary': market_summary
         }
         self.decisions_history.append(decision_record)
+        self._queue.put(('decision', decision_record))
+        self.flush()
+    
+    def flush(self):
+        """Write buffered records to disk once the ones queued so far are written"""
+        self._queue.put(('flush', None))
+    
+    def _drain(self):
+        """Writer thread: write queued records, flushing only when asked to"""
+        while True:
+            item = self._queue.get()
+            if isinstance(item, logging.LogRecord):
+                # General log record from the QueueHandler (message already formatted)
+                self._log_handler.handle(item)
+                continue
+            
+            kind, payload = item
+            if kind is None:
+                break
+            
+            try:
+                if kind == 'flush':
+                    self._log_handler.flush()
+                    for f in self._files.values():
+                        f.flush()
+                elif kind == 'trade':
+                    self._trade_writer.writerow(payload)
+                else:
+                    self._files[kind].write(_dumps_line(payload))
+            except Exception as e:
+                print(f"⚠️  Logger write failed: {e}")
         
-        # Write all decisions history to file
-        with open(self.decisions_log, 'w', encoding='utf-8') as f:
-            json.dump(self.decisions_history, f, indent=2)
+        self._log_handler.close()  # flushes the buffered records first
+        self._log_file.close()
+        for f in self._files.values():
+            f.close()
+    
+    def close(self):
+        """Drain pending records and close the log files"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((None, None))
+        self._writer.join()
+        self._logger.handlers.clear()
     
     def print_summary(self, stats: Dict, current_prices: Dict[str, float]):
         """Print formatted summary to console and log"""
@@ -183,6 +280,7 @@ if __name__ == "__main__":
     }
     
     logger.log_statistics(test_stats)
+    logger.close()
     
     print(f"\nLogs created in: {logger.log_dir}")
     print(f"Session ID: {logger.session_id}")
@@ -0,0 +1,98 @@
+"""
+Structure-of-arrays price and position books for the per-iteration trigger scan
+"""
+
+import numpy as np
+from typing import Dict, List, Optional
+
+# Position side codes stored in POSITION_DTYPE['type']
+LONG, SHORT = 0, 1
+
+POSITION_DTYPE = np.dtype([
+    ('symbol_idx', np.int32),
+    ('type', np.int8),
+    ('entry', np.float64),
+    ('target', np.float64),  # NaN when no target is set
+    ('stop', np.float64),  # NaN when no stop loss is set
+])
+
+
+class PriceBook:
+    """Prices for a fixed list of symbols held in one float64 array (NaN where missing)"""
+    
+    def __init__(self, symbols: List[str], prices: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            symbols: Trading pair symbols, fixing the array order
+            prices: Optional initial prices by symbol
+        """
+        self.symbols = list(symbols)
+        self.idx: Dict[str, int] = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.prices = np.full(len(self.symbols), np.nan)
+        if prices:
+            self.update(prices)
+    
+    def update(self, prices: Dict[str, float]):
+        """Set prices by symbol; symbols outside the book are ignored"""
+        for symbol, price in prices.items():
+            i = self.idx.get(symbol)
+            if i is not None:
+                self.prices[i] = price
+    
+    def copy(self) -> 'PriceBook':
+        """Copy sharing the symbol index but not the price array"""
+        book = PriceBook.__new__(PriceBook)
+        book.symbols = self.symbols
+        book.idx = self.idx
+        book.prices = self.prices.copy()
+        return book
+    
+    def with_prices(self, prices: Dict[str, float]) -> 'PriceBook':
+        """New book on the same symbol index holding only the given prices"""
+        book = PriceBook.__new__(PriceBook)
+        book.symbols = self.symbols
+        book.idx = self.idx
+        # One pass over the fixed symbol list straight into the array
+        book.prices = np.fromiter((prices.get(symbol, np.nan) for symbol in self.symbols),
+                                  dtype=np.float64, count=len(self.symbols))
+        return book
+    
+    def get(self, symbol: str) -> Optional[float]:
+        """Price for a symbol, or None if unknown or missing"""
+        i = self.idx.get(symbol)
+        if i is None or np.isnan(self.prices[i]):
+            return None
+        return float(self.prices[i])
+    
+    def is_empty(self) -> bool:
+        """True when no symbol has a price"""
+        return bool(np.isnan(self.prices).all())
+    
+    def to_dict(self) -> Dict[str, float]:
+        """Prices by symbol, skipping missing ones"""
+        return {symbol: price for symbol, price in zip(self.symbols, self.prices.tolist())
+                if price == price}
+
+
+def positions_array(open_positions: List[Dict], book: PriceBook) -> np.recarray:
+    """
+    Pack position summaries into a POSITION_DTYPE record array indexed against a book
+    
+    Args:
+        open_positions: Position dicts with 'symbol', 'type' and optionally
+                        'entry_price', 'target_price', 'stop_loss'
+        book: PriceBook whose symbol order symbol_idx refers to
+    
+    Returns:
+        Record array with one row per position whose symbol is in the book
+    """
+    rows = [
+        (book.idx[pos['symbol']],
+         SHORT if pos['type'] == 'short' else LONG,
+         pos.get('entry_price') or np.nan,
+         pos.get('target_price') or np.nan,
+         pos.get('stop_loss') or np.nan)
+        for pos in open_positions
+        if pos['symbol'] in book.idx
+    ]
+    return np.array(rows, dtype=POSITION_DTYPE).view(np.recarray)
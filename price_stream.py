@@ -0,0 +1,102 @@
+"""
+Binance WebSocket ticker stream that keeps the latest prices in memory
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    _loads = json.loads
+
+
+class PriceStream:
+    """Background subscription to Binance @ticker streams for a fixed set of symbols"""
+    
+    STREAM_URL = "wss://stream.binance.com:9443/stream?streams="
+    RECONNECT_DELAY = 5  # seconds to wait before reconnecting
+    STALE_AFTER = 10  # seconds without an update before a price is not trusted
+    
+    def __init__(self, symbols: List[str],
+                 on_price: Optional[Callable[[str, float], None]] = None):
+        """
+        Args:
+            symbols: Trading pair symbols to subscribe to
+            on_price: Optional callback invoked as on_price(symbol, price) on every update
+        """
+        self.symbols = list(symbols)
+        self.on_price = on_price
+        self.last_prices: Dict[str, float] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the stream in a daemon thread with its own event loop"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name='price-stream', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the stream and its background thread"""
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def get_price(self, symbol: str) -> Optional[float]:
+        """Latest streamed price, or None if missing or stale"""
+        updated_at = self._updated_at.get(symbol)
+        if updated_at is None or time.monotonic() - updated_at > self.STALE_AFTER:
+            return None
+        return self.last_prices.get(symbol)
+    
+    def get_prices(self, symbols: List[str]) -> Optional[Dict[str, float]]:
+        """Latest streamed prices for all symbols, or None if any is missing or stale"""
+        prices = {}
+        for symbol in symbols:
+            price = self.get_price(symbol)
+            if price is None:
+                return None
+            prices[symbol] = price
+        return prices
+    
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self._run())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+    
+    async def _run(self):
+        import websockets  # only needed when streaming is enabled
+        
+        url = self.STREAM_URL + '/'.join(f"{s.lower()}@ticker" for s in self.symbols)
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=20) as ws:
+                    print(f"✅ Price stream connected ({len(self.symbols)} symbols)")
+                    async for message in ws:
+                        data = _loads(message)['data']
+                        symbol = data['s']
+                        price = float(data['c'])
+                        self.last_prices[symbol] = price
+                        self._updated_at[symbol] = time.monotonic()
+                        if self.on_price is not None:
+                            self.on_price(symbol, price)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Price stream disconnected: {e}")
+            await asyncio.sleep(self.RECONNECT_DELAY)
@@ -5,12 +5,28 @@ Binance Real Trading API Integration
 
 import hmac
 import hashlib
+import json
+import threading
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlencode
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库解析
+    orjson = None
+
+
+def _loads(data: bytes):
+    """解析响应体 JSON（orjson.JSONDecodeError 是 ValueError 的子类）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class BinanceRealTrader:
     """
@@ -22,6 +38,8 @@ class BinanceRealTrader:
     3. 设置在 .env 文件中
     """
     
+    ACCOUNT_CACHE_TTL = 0.5  # 秒，账户信息在此时间内复用；任何下单/撤单后立即失效
+    
     def __init__(self, api_key: str, api_secret: str, testnet: bool = True):
         """
         初始化Binance交易客户端
@@ -33,6 +51,8 @@ class BinanceRealTrader:
         """
         self.api_key = api_key
         self.api_secret = api_secret
+        # 密钥只做一次 HMAC 初始化（ipad/opad），每次签名复制这个状态即可
+        self._hmac = hmac.new(api_secret.encode('utf-8'), digestmod=hashlib.sha256)
         
         if testnet:
             # 测试网地址
@@ -46,16 +66,30 @@ class BinanceRealTrader:
         self.headers = {
             'X-MBX-APIKEY': self.api_key
         }
-    
-    def _generate_signature(self, params: Dict) -> str:
-        """生成请求签名"""
-        query_string = urlencode(params)
-        signature = hmac.new(
-            self.api_secret.encode('utf-8'),
-            query_string.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
+        
+        # 复用连接，避免每次请求重新进行 TCP/TLS 握手
+        # 默认的 Retry 不会重试 POST，下单请求不会被重复提交
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        self.session.mount('https://', adapter)
+        self.session.headers.update(self.headers)
+        
+        # (time.monotonic() 请求发出时间, 账户信息)
+        self._account_cache: Tuple[float, Optional[Dict]] = (0.0, None)
+        
+        # 交易所的数量精度规则，首次下单取整时才请求 exchangeInfo（只加载一次）
+        self._quantity_precision: Optional[Dict[str, int]] = None
+        self._precision_lock = threading.Lock()
+    
+    def _generate_signature(self, query_string: str) -> str:
+        """生成请求签名（对已编码的查询字符串签名）"""
+        mac = self._hmac.copy()
+        mac.update(query_string.encode('utf-8'))
+        return mac.hexdigest()
     
     def _request(self, method: str, endpoint: str, params: Dict = None, signed: bool = False) -> Dict:
         """发送HTTP请求"""
@@ -65,27 +99,29 @@ class BinanceRealTrader:
             params = {}
         
         if signed:
-            params['timestamp'] = int(time.time() * 1000)
-            params['signature'] = self._generate_signature(params)
+            # 查询字符串只编码一次：签名的正是发送出去的这一串
+            query_string = urlencode({**params, 'timestamp': int(time.time() * 1000)})
+            url = f"{url}?{query_string}&signature={self._generate_signature(query_string)}"
+            params = None
+        
+        if method not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"Unsupported method: {method}")
         
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=self.headers, params=params, timeout=10)
-            elif method == 'POST':
-                response = requests.post(url, headers=self.headers, params=params, timeout=10)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=self.headers, params=params, timeout=10)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-            
+            response = self.session.request(method, url, params=params, timeout=10)
             response.raise_for_status()
-            return response.json()
+            return _loads(response.content)
         
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"❌ API请求失败: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"   Response: {e.response.text}")
             return None
+        
+        finally:
+            if method != 'GET':
+                # 下单、撤单、改杠杆都会改变账户，缓存的账户信息作废（失败的请求也可能已生效）
+                self._account_cache = (0.0, None)
     
     # ===== 账户信息 =====
     
@@ -102,17 +138,31 @@ class BinanceRealTrader:
                 'positions': [...],                      # 持仓信息
                 ...
             }
+            
+            ACCOUNT_CACHE_TTL 内的重复调用返回同一份结果，调用方不要修改它
         """
-        return self._request('GET', '/fapi/v2/account', signed=True)
+        fetched_at, account = self._account_cache
+        now = time.monotonic()
+        if account is not None and now - fetched_at < self.ACCOUNT_CACHE_TTL:
+            return account
+        
+        account = self._request('GET', '/fapi/v2/account', signed=True)
+        if account is not None:
+            self._account_cache = (now, account)
+        return account
     
-    def get_balance(self) -> Optional[Dict[str, float]]:
+    def get_balance(self, account: Optional[Dict] = None) -> Optional[Dict[str, float]]:
         """
         获取账户余额
         
+        Args:
+            account: 已获取的账户信息，传入时不再重复请求
+        
         Returns:
             {'USDT': 1000.00, 'BNB': 0.5, ...}
         """
-        account = self.get_account_info()
+        if account is None:
+            account = self.get_account_info()
         if not account:
             return None
         
@@ -124,14 +174,18 @@ class BinanceRealTrader:
         
         return balances
     
-    def get_available_balance(self) -> Optional[float]:
+    def get_available_balance(self, account: Optional[Dict] = None) -> Optional[float]:
         """
         获取可用余额（USDT）
         
+        Args:
+            account: 已获取的账户信息，传入时不再重复请求
+        
         Returns:
             可用USDT余额
         """
-        account = self.get_account_info()
+        if account is None:
+            account = self.get_account_info()
         if not account:
             return None
         
@@ -139,10 +193,13 @@ class BinanceRealTrader:
     
     # ===== 持仓管理 =====
     
-    def get_positions(self) -> Optional[List[Dict]]:
+    def get_positions(self, account: Optional[Dict] = None) -> Optional[List[Dict]]:
         """
         获取当前持仓
         
+        Args:
+            account: 已获取的账户信息，传入时不再重复请求
+        
         Returns:
             [
                 {
@@ -156,7 +213,8 @@ class BinanceRealTrader:
                 }
             ]
         """
-        account = self.get_account_info()
+        if account is None:
+            account = self.get_account_info()
         if not account:
             return None
         
@@ -234,32 +292,37 @@ class BinanceRealTrader:
         
         return self._request('POST', '/fapi/v1/order', params=params, signed=True)
     
-    def close_position(self, symbol: str, position_side: str) -> Optional[Dict]:
+    @staticmethod
+    def index_positions(positions: Optional[List[Dict]]) -> Dict[tuple, Dict]:
+        """
+        按 (交易对, 'LONG'/'SHORT') 建立持仓索引，同一键只保留第一条
+        
+        Args:
+            positions: get_positions() 的返回值
+        """
+        index = {}
+        for pos in positions or []:
+            pos_amt = float(pos['positionAmt'])
+            if pos_amt:
+                index.setdefault((pos['symbol'], 'LONG' if pos_amt > 0 else 'SHORT'), pos)
+        return index
+    
+    def close_position(self, symbol: str, position_side: str,
+                       position: Optional[Dict] = None) -> Optional[Dict]:
         """
         平仓（市价全部平仓）
         
         Args:
             symbol: 交易对
             position_side: 'LONG' 或 'SHORT'
+            position: 已查到的持仓，传入时不再重复请求
         
         Returns:
             订单信息
         """
         # 获取当前持仓数量
-        positions = self.get_positions()
-        if not positions:
-            return None
-        
-        position = None
-        for pos in positions:
-            if pos['symbol'] == symbol:
-                pos_amt = float(pos['positionAmt'])
-                if position_side == 'LONG' and pos_amt > 0:
-                    position = pos
-                    break
-                elif position_side == 'SHORT' and pos_amt < 0:
-                    position = pos
-                    break
+        if position is None:
+            position = self.index_positions(self.get_positions()).get((symbol, position_side))
         
         if not position:
             print(f"❌ 未找到持仓: {symbol} {position_side}")
@@ -288,14 +351,42 @@ class BinanceRealTrader:
         return None
     
     def get_multiple_prices(self, symbols: List[str]) -> Dict[str, float]:
-        """获取多个交易对的价格"""
+        """获取多个交易对的价格（不带 symbol 请求一次取回全部行情，再按需过滤）"""
+        result = self._request('GET', '/fapi/v1/ticker/price')
+        if not result:
+            return {}
+        
+        wanted = set(symbols)
         prices = {}
-        for symbol in symbols:
-            price = self.get_price(symbol)
-            if price:
-                prices[symbol] = price
+        for row in result:
+            if row['symbol'] in wanted:
+                price = float(row['price'])
+                if price:
+                    prices[row['symbol']] = price
         return prices
     
+    # ===== 交易规则 =====
+    
+    def load_quantity_precision(self) -> Dict[str, int]:
+        """
+        各交易对的 quantityPrecision（来自 /fapi/v1/exchangeInfo），首次调用时加载一次
+        
+        Returns:
+            交易对 -> 小数位数；请求失败时为空字典，取整时使用内置表 QUANTITY_PRECISION
+        """
+        with self._precision_lock:
+            if self._quantity_precision is None:
+                info = self._request('GET', '/fapi/v1/exchangeInfo')
+                self._quantity_precision = {
+                    s['symbol']: int(s['quantityPrecision'])
+                    for s in (info or {}).get('symbols', []) if 'quantityPrecision' in s
+                }
+                if self._quantity_precision:
+                    print("✅ 已加载交易所数量精度规则")
+                else:
+                    print("⚠️  未能加载交易所数量精度规则，使用内置精度表")
+            return self._quantity_precision
+    
     # ===== 订单查询 =====
     
     def get_open_orders(self, symbol: str = None) -> Optional[List[Dict]]:
@@ -345,7 +436,18 @@ def calculate_quantity_from_usdt(usdt_amount: float, price: float, leverage: int
     return quantity
 
 
-def round_quantity(symbol: str, quantity: float) -> float:
+# 内置的各交易对数量精度（小数位数），交易所规则（load_quantity_precision）缺少某交易对时使用
+QUANTITY_PRECISION: Dict[str, int] = {
+    'BTCUSDT': 3,
+    'ETHUSDT': 3,
+    'BNBUSDT': 2,
+    'ADAUSDT': 0,  # 整数
+    'SOLUSDT': 0,  # 整数（修复：从1改为0）
+}
+DEFAULT_QUANTITY_PRECISION = 1
+
+
+def round_quantity(symbol: str, quantity: float, precision: Optional[Dict[str, int]] = None) -> float:
     """
     根据交易对规则调整数量精度
     
@@ -354,20 +456,14 @@ def round_quantity(symbol: str, quantity: float) -> float:
     - ETH: 3位小数
     - BNB: 2位小数
     - 小币种: 整数
+    
+    Args:
+        precision: 可选，交易所规则（BinanceRealTrader.load_quantity_precision），优先于内置表
     """
-    # 根据Binance合约规则调整精度
-    if symbol == 'BTCUSDT':
-        return round(quantity, 3)
-    elif symbol == 'ETHUSDT':
-        return round(quantity, 3)
-    elif symbol == 'BNBUSDT':
-        return round(quantity, 2)
-    elif symbol == 'ADAUSDT':
-        return round(quantity, 0)  # 整数
-    elif symbol == 'SOLUSDT':
-        return round(quantity, 0)  # 整数（修复：从1改为0）
-    else:
-        return round(quantity, 1)
+    digits = precision.get(symbol) if precision else None
+    if digits is None:
+        digits = QUANTITY_PRECISION.get(symbol, DEFAULT_QUANTITY_PRECISION)
+    return round(quantity, digits)
 
 
 # ===== 测试代码 =====
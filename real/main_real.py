@@ -5,21 +5,28 @@ Real Trading Bot - 真实交易版本
 
 import time
 from datetime import datetime
+import logging
 import signal
 import sys
 import argparse
-from typing import Dict
+from typing import Dict, Optional
 import threading
+import traceback
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # 添加父目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DECISION_INTERVAL, TRADING_PAIRS
+from config import (
+    DECISION_INTERVAL, TRADING_PAIRS, USE_PRICE_STREAM, CHART_HISTORY_ITEMS, EMERGENCY_THRESHOLD
+)
 from crypto_api import CryptoAPI
-from technical_analysis import analyze_market
-from llm_agent_advanced import AdvancedTradingAgent
+from technical_analysis import analyze_markets
+from llm_agent_advanced import AdvancedTradingAgent, parse_action
+from price_book import PriceBook, positions_array
+from history_buffer import HistoryBuffer
 from logger import TradingLogger
 from web_server import update_trading_data, update_llm_conversation, run_server
 
@@ -53,29 +60,104 @@ class RealTradingBot:
         self.agent = AdvancedTradingAgent()
         self.executor = RealTradingExecutor(self.api_key, self.api_secret, self.testnet)
         self.logger = TradingLogger()
+        # 与价格并发获取账户信息；LLM 流式输出期间预取持仓
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='account')
+        self._positions_future: Optional[Future] = None  # 本次决策预取的持仓索引
         
         self.running = False
-        self.last_decision_time = 0
-        self.last_prices = {}
+        self._wake_event = threading.Event()  # stop()/run_now() 时置位，立即结束迭代间的等待
+        self.last_decision_time = float('-inf')  # 上次LLM决策的 time.monotonic()
+        self.last_book = None  # PriceBook from the previous iteration
         self.iteration_count = 0
+        # 交易对在启动后固定: 每次迭代的价格簿共用同一符号索引，价格日志模板一次 str.format 填充
+        self._pairs = tuple(TRADING_PAIRS)
+        self._empty_book = PriceBook(self._pairs)
+        if USE_PRICE_STREAM:
+            # 推送价格出现紧急波动时提前唤醒主循环（回调用到上面的 last_book）
+            self.api.start_price_stream(TRADING_PAIRS, on_price=self._on_stream_price)
+        self._price_line = ", ".join(f"{s}: ${{:,.2f}}" for s in self._pairs)
+        # 各交易对的技术指标结果，K线未变化时直接复用
+        self._ta_cache = {}
         
         # 历史数据
-        self.value_history = []
+        self.value_history = HistoryBuffer('value', CHART_HISTORY_ITEMS)
         self.price_history = {}
         
         # 信号处理
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
     
+    def stop(self):
+        """通知主循环退出，不必等完当前的休眠"""
+        self.running = False
+        self._wake_event.set()
+    
+    def run_now(self):
+        """跳过剩余的休眠，立即开始下一轮迭代"""
+        self._wake_event.set()
+    
+    def _on_stream_price(self, symbol: str, price: float):
+        """
+        价格流回调（在价格流线程中执行）：推送价格相对上次迭代的价格簿
+        超过 EMERGENCY_THRESHOLD 时立即开始下一次迭代
+        
+        该迭代的 should_request_decision 会检测到同一波动并请求决策。
+        """
+        last = self.last_book
+        reference = last.get(symbol) if last is not None else None
+        if reference and abs(price - reference) / reference > EMERGENCY_THRESHOLD:
+            self.run_now()
+    
     def _signal_handler(self, signum, frame):
         """处理关闭信号"""
         if not self.running:
             sys.exit(0)
         print("\n\n收到关闭信号，正在退出...")
-        self.running = False
+        self.stop()
     
-    def execute_actions(self, actions: list, current_prices: Dict[str, float], chain_of_thought: Dict = None):
-        """执行LLM决策的交易动作"""
+    def _on_partial_decision(self, kind: str, value):
+        """
+        LLM 流式输出回调：每个动作一完整就预检查
+        
+        首个平仓动作到达时即在后台查询持仓，账户请求与剩余输出的生成重叠，
+        execute_actions 直接使用结果。
+        """
+        if kind != 'action':
+            return
+        try:
+            record = parse_action(value)
+        except Exception as e:
+            self.logger.log(f"  ⚠️  收到无法解析的动作: {e}")
+            return
+        action, symbol = record.action, record.symbol
+        
+        self.logger.log(f"  ⏳ 收到动作: {action.upper()} {symbol}")
+        if symbol not in self._pairs:
+            self.logger.log(f"  ⚠️  未知交易对: {symbol}")
+        
+        if action == 'close' and self._positions_future is None:
+            trader = self.executor.trader
+            self._positions_future = self._io_pool.submit(
+                lambda: trader.index_positions(trader.get_positions()))
+    
+    def _batch_positions_index(self, positions_future: Optional[Future]) -> Dict[tuple, Dict]:
+        """本批次平仓用的持仓索引：优先用流式输出期间预取的结果"""
+        trader = self.executor.trader
+        if positions_future is not None:
+            try:
+                return positions_future.result()
+            except Exception as e:
+                self.logger.log(f"  ⚠️  预取持仓失败，重新查询: {e}")
+        return trader.index_positions(trader.get_positions())
+    
+    def execute_actions(self, actions: list, current_prices: Dict[str, float], chain_of_thought: Dict = None,
+                        positions_future: Optional[Future] = None):
+        """
+        执行LLM决策的交易动作
+        
+        Args:
+            positions_future: 可选，_on_partial_decision 预取的持仓索引
+        """
         if not actions:
             self.logger.log("无操作")
             return
@@ -84,17 +166,14 @@ class RealTradingBot:
         
         self.logger.log(f"\n执行 {len(actions)} 个动作:")
         
+        # 本批次平仓共用的持仓索引：首次平仓时查询一次，开仓后作废
+        positions_index = None
+        
         for i, action_data in enumerate(actions, 1):
             try:
-                action = action_data.get('action', '').lower()
-                symbol = action_data.get('symbol', '')
-                reason = action_data.get('reason', '')
+                action, symbol, reason, position_type, size, leverage = parse_action(action_data)
                 
                 if action == 'open':
-                    position_type = action_data.get('position_type', '').lower()
-                    size = float(action_data.get('size', 0))
-                    leverage = float(action_data.get('leverage', 1))
-                    
                     # 提取目标价和止损价
                     target_price = None
                     stop_loss = None
@@ -109,6 +188,8 @@ class RealTradingBot:
                                   f"(杠杆: {leverage}x){target_str}{stop_str}")
                     self.logger.log(f"     原因: {reason}")
                     
+                    positions_index = None
+                    positions_future = None  # 预取结果早于本次开仓
                     position = self.executor.open_position(
                         symbol=symbol,
                         position_type=position_type,
@@ -131,15 +212,17 @@ class RealTradingBot:
                             self.logger.log(f"     ⚠️  资金不足 (还需 ${margin_needed - available:.2f})")
                 
                 elif action == 'close':
-                    position_type = action_data.get('position_type', '').lower()
-                    
                     self.logger.log(f"  📉 平仓 {position_type.upper()}: {symbol}")
                     self.logger.log(f"     原因: {reason}")
                     
+                    if positions_index is None:
+                        positions_index = self._batch_positions_index(positions_future)
+                        positions_future = None
                     success = self.executor.close_position(
                         symbol=symbol,
                         position_type=position_type,
-                        current_price=current_prices[symbol]
+                        current_price=current_prices[symbol],
+                        positions_index=positions_index
                     )
                     
                     if success:
@@ -155,44 +238,45 @@ class RealTradingBot:
             
             except Exception as e:
                 self.logger.log(f"  ❌ 执行动作时出错: {e}")
-                import traceback
                 traceback.print_exc()
     
+    def _format_prices(self, current_prices: Dict[str, float]) -> str:
+        """格式化价格日志（所有交易对齐全时使用预生成模板）"""
+        try:
+            return self._price_line.format(*[current_prices[s] for s in self._pairs])
+        except KeyError:
+            return ", ".join(f"{s}: ${p:,.2f}" for s, p in current_prices.items())
+    
     def run_iteration(self):
         """运行一次迭代"""
         self.iteration_count += 1
-        current_time = time.time()
+        current_time = time.monotonic()
         
         self.logger.log(f"\n--- 迭代 {self.iteration_count} ---")
         
-        # 1. 获取价格
-        current_prices = self.api.get_multiple_prices(TRADING_PAIRS)
+        # 1. 获取价格（账户信息与价格无依赖，并发请求）
+        account_future = self._io_pool.submit(self.executor.trader.get_account_info)
+        current_prices = self.api.get_multiple_prices(self._pairs)
         if not current_prices:
             self.logger.log("❌ 获取价格失败")
             return
+        account = account_future.result()
         
-        price_str = ", ".join([f"{s}: ${p:,.2f}" for s, p in current_prices.items()])
-        self.logger.log(f"当前价格: {price_str}")
+        if self.logger.is_enabled_for(logging.DEBUG):
+            self.logger.debug("当前价格: %s", self._format_prices(current_prices))
         
         # 2. 获取统计
-        stats = self.executor.get_statistics(current_prices)
-        open_positions = self.executor.get_open_positions_summary(current_prices)
+        stats, open_positions = self.executor.get_portfolio_snapshot(current_prices, account)
         
         # 3. 更新历史数据
         timestamp = datetime.now().isoformat()
         
-        self.value_history.append({
-            'timestamp': timestamp,
-            'value': stats['total_value']
-        })
+        self.value_history.append(timestamp, stats['total_value'])
         
         for symbol, price in current_prices.items():
             if symbol not in self.price_history:
-                self.price_history[symbol] = []
-            self.price_history[symbol].append({
-                'timestamp': timestamp,
-                'price': price
-            })
+                self.price_history[symbol] = HistoryBuffer('price', CHART_HISTORY_ITEMS)
+            self.price_history[symbol].append(timestamp, price)
         
         # 4. 更新Web界面
         closed_trades = self.executor.closed_positions
@@ -201,33 +285,36 @@ class RealTradingBot:
         
         # 5. 检查是否需要LLM决策
         time_since_last = current_time - self.last_decision_time
+        current_book = self._empty_book.with_prices(current_prices)
         should_decide, trigger_reason = self.agent.should_request_decision(
-            current_prices,
-            self.last_prices,
+            current_book,
+            self.last_book,
             time_since_last,
             DECISION_INTERVAL,
-            open_positions
+            positions_array(open_positions, current_book)
         )
         
         if should_decide:
             self.logger.log(f"\n=== 请求LLM决策 (触发: {trigger_reason}) ===")
             
             # 获取市场分析
-            market_data = {}
-            for symbol in TRADING_PAIRS:
-                klines = self.api.get_klines(symbol, interval='15m', limit=100)
-                if klines:
-                    market_data[symbol] = analyze_market(klines)
+            klines_by_symbol = self.api.get_klines_batch(self._pairs, interval='15m', limit=100)
+            market_data = analyze_markets(klines_by_symbol, self._ta_cache)
             
-            # 请求LLM决策
+            # 请求LLM决策（动作在流式输出中逐个预检查）
+            self._positions_future = None
             decision = self.agent.make_decision(
                 current_prices=current_prices,
                 open_positions=open_positions,
                 account_balance=stats['current_capital'],
-                market_data=market_data
+                market_data=market_data,
+                on_partial=self._on_partial_decision
             )
             
-            if decision:
+            if decision and decision.get('cached'):
+                # 与上次决策时状态相同：不重复记录、不重放动作
+                self.logger.log("🤖 状态未变化，沿用上次决策（观望）")
+            elif decision:
                 # 记录LLM对话
                 self.logger.log(f"🤖 LLM总结: {decision['summary']}")
                 update_llm_conversation(decision)
@@ -236,13 +323,14 @@ class RealTradingBot:
                 self.execute_actions(
                     decision['actions'],
                     current_prices,
-                    decision.get('chain_of_thought')
+                    decision.get('chain_of_thought'),
+                    self._positions_future
                 )
             
             self.last_decision_time = current_time
         
         # 6. 更新上次价格
-        self.last_prices = current_prices.copy()
+        self.last_book = current_book
         
         # 7. 定期输出统计
         if self.iteration_count % 10 == 0:
@@ -263,8 +351,7 @@ class RealTradingBot:
         try:
             current_prices = self.api.get_multiple_prices(TRADING_PAIRS)
             if current_prices:
-                stats = self.executor.get_statistics(current_prices)
-                open_positions = self.executor.get_open_positions_summary(current_prices)
+                stats, open_positions = self.executor.get_portfolio_snapshot(current_prices)
                 closed_trades = self.executor.closed_positions
                 
                 update_trading_data(current_prices, open_positions, stats, closed_trades,
@@ -276,14 +363,12 @@ class RealTradingBot:
         try:
             while self.running:
                 self.run_iteration()
-                time.sleep(sleep_seconds)
-        
-        except KeyboardInterrupt:
-            self.logger.log("\n收到键盘中断")
+                self.logger.flush()
+                self._wake_event.wait(sleep_seconds)
+                self._wake_event.clear()
         
         except Exception as e:
             self.logger.log(f"\n❌ 错误: {e}")
-            import traceback
             traceback.print_exc()
         
         finally:
@@ -292,6 +377,9 @@ class RealTradingBot:
     def shutdown(self):
         """关闭机器人"""
         self.logger.log("\n=== 机器人关闭 ===")
+        self.api.close()
+        self._io_pool.shutdown(wait=False)
+        self.logger.close()
         self.running = False
 
 
@@ -337,7 +425,7 @@ def main():
         run_server(host='127.0.0.1', port=5000, debug=False)
     except KeyboardInterrupt:
         print("\n关闭中...")
-        bot.running = False
+        bot.stop()
         bot_thread.join(timeout=5)
 
 
@@ -3,7 +3,7 @@ Real Trading Executor - 真实交易执行器
 替换原来的 TradingSimulator，连接真实的Binance账户
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from binance_real_trader import BinanceRealTrader, calculate_quantity_from_usdt, round_quantity
 
@@ -42,6 +42,9 @@ class RealTradingExecutor:
         # 记录本地交易历史（因为API可能有限制）
         self.trade_history: List[Dict] = []
         self.trade_history_file = 'real_trade_history.json'
+        # closed_positions 的增量缓存: 已转换的平仓记录，以及已扫描到的 trade_history 位置
+        self._closed: List[Dict] = []
+        self._closed_scanned = 0
         
         # 加载历史交易记录
         self._load_trade_history()
@@ -77,14 +80,19 @@ class RealTradingExecutor:
     
     # ===== 账户信息 =====
     
-    def get_total_value(self, current_prices: Dict[str, float] = None) -> float:
+    def get_total_value(self, current_prices: Dict[str, float] = None,
+                        account: Optional[Dict] = None) -> float:
         """
         获取账户总价值
         
+        Args:
+            account: 已获取的账户信息，传入时不再重复请求
+        
         Returns:
             账户总价值（包括持仓和未实现盈亏）
         """
-        account = self.trader.get_account_info()
+        if account is None:
+            account = self.trader.get_account_info()
         if not account:
             return 0.0
         
@@ -100,15 +108,19 @@ class RealTradingExecutor:
         
         return total_margin
     
-    def get_available_capital(self) -> float:
-        """获取可用资金"""
-        balance = self.trader.get_available_balance()
+    def get_available_capital(self, account: Optional[Dict] = None) -> float:
+        """获取可用资金（传入已获取的账户信息时不再重复请求）"""
+        balance = self.trader.get_available_balance(account)
         return balance if balance is not None else 0.0
     
-    def get_statistics(self, current_prices: Dict[str, float]) -> Dict:
+    def get_statistics(self, current_prices: Dict[str, float], account: Optional[Dict] = None) -> Dict:
         """
         获取交易统计
         
+        Args:
+            current_prices: 当前价格
+            account: 已获取的账户信息，传入时不再重复请求
+        
         Returns:
             {
                 'initial_capital': 初始资金,
@@ -121,7 +133,8 @@ class RealTradingExecutor:
                 ...
             }
         """
-        account = self.trader.get_account_info()
+        if account is None:
+            account = self.trader.get_account_info()
         if not account:
             return self._empty_stats()
         
@@ -134,8 +147,8 @@ class RealTradingExecutor:
         
         available = float(account.get('availableBalance', 0))
         
-        # 计算持仓
-        positions = self.trader.get_positions()
+        # 计算持仓（持仓信息包含在账户信息中）
+        positions = self.trader.get_positions(account)
         num_positions = len(positions) if positions else 0
         
         # 计算盈亏
@@ -162,6 +175,21 @@ class RealTradingExecutor:
             'win_rate': win_rate,
         }
     
+    def get_portfolio_snapshot(self, current_prices: Dict[str, float],
+                               account: Optional[Dict] = None) -> Tuple[Dict, List[Dict]]:
+        """
+        用同一份账户信息获取统计和持仓摘要
+        
+        Returns:
+            (get_statistics() 结果, get_open_positions_summary() 结果)
+        """
+        if account is None:
+            account = self.trader.get_account_info()
+        if not account:
+            return self._empty_stats(), []
+        return (self.get_statistics(current_prices, account),
+                self.get_open_positions_summary(current_prices, account))
+    
     def _empty_stats(self) -> Dict:
         """返回空的统计数据"""
         return {
@@ -180,10 +208,15 @@ class RealTradingExecutor:
     
     # ===== 持仓管理 =====
     
-    def get_open_positions_summary(self, current_prices: Dict[str, float]) -> List[Dict]:
+    def get_open_positions_summary(self, current_prices: Dict[str, float],
+                                   account: Optional[Dict] = None) -> List[Dict]:
         """
         获取持仓摘要
         
+        Args:
+            current_prices: 当前价格
+            account: 已获取的账户信息，传入时不再重复请求
+        
         Returns:
             [
                 {
@@ -198,7 +231,7 @@ class RealTradingExecutor:
                 }
             ]
         """
-        positions = self.trader.get_positions()
+        positions = self.trader.get_positions(account)
         if not positions:
             return []
         
@@ -274,7 +307,7 @@ class RealTradingExecutor:
         
         # 计算币的数量
         quantity = calculate_quantity_from_usdt(size, current_price, leverage)
-        quantity = round_quantity(symbol, quantity)
+        quantity = round_quantity(symbol, quantity, self.trader.load_quantity_precision())
         
         if quantity <= 0:
             print(f"❌ 数量计算错误: {quantity}")
@@ -348,7 +381,8 @@ class RealTradingExecutor:
             'stop_loss': stop_loss,
         }
     
-    def close_position(self, symbol: str, position_type: str, current_price: float = None) -> bool:
+    def close_position(self, symbol: str, position_type: str, current_price: float = None,
+                       positions_index: Optional[Dict[tuple, Dict]] = None) -> bool:
         """
         平仓
         
@@ -356,6 +390,7 @@ class RealTradingExecutor:
             symbol: 交易对
             position_type: 'long' 或 'short'
             current_price: 当前价格（用于计算盈亏）
+            positions_index: trader.index_positions() 的结果，传入时不再重复请求
         
         Returns:
             是否成功
@@ -364,27 +399,19 @@ class RealTradingExecutor:
         
         print(f"📤 发送平仓订单: {symbol} {position_side}")
         
-        # 获取持仓信息（用于记录完整的交易数据）
-        positions = self.trader.get_positions()
-        target_position = None
-        if positions:
-            for pos in positions:
-                if pos['symbol'] == symbol:
-                    pos_amt = float(pos['positionAmt'])
-                    if position_side == 'LONG' and pos_amt > 0:
-                        target_position = pos
-                        break
-                    elif position_side == 'SHORT' and pos_amt < 0:
-                        target_position = pos
-                        break
+        # 获取持仓信息（用于记录完整的交易数据），同一条持仓直接交给下单，不再查第二次
+        if positions_index is None:
+            positions_index = self.trader.index_positions(self.trader.get_positions())
+        target_position = positions_index.get((symbol, position_side))
         
         # 提取持仓信息用于记录
         entry_price = float(target_position.get('entryPrice', 0)) if target_position else 0
         leverage = int(target_position.get('leverage', 1)) if target_position else 1
         position_amt = float(target_position.get('positionAmt', 0)) if target_position else 0
         
-        # 执行平仓
-        result = self.trader.close_position(symbol, position_side)
+        # 执行平仓；无论成败，这条持仓的索引项都已不可信，后续平仓重新查询
+        result = self.trader.close_position(symbol, position_side, target_position)
+        positions_index.pop((symbol, position_side), None)
         
         if not result:
             print(f"❌ 平仓失败")
@@ -433,13 +460,11 @@ class RealTradingExecutor:
             print("ℹ️  当前无持仓")
             return
         
-        for pos in positions:
-            symbol = pos['symbol']
-            pos_amt = float(pos['positionAmt'])
-            position_side = 'LONG' if pos_amt > 0 else 'SHORT'
+        positions_index = self.trader.index_positions(positions)
+        for symbol, position_side in list(positions_index):  # close_position pops closed entries
             current_price = current_prices.get(symbol)
             
-            self.close_position(symbol, position_side.lower(), current_price)
+            self.close_position(symbol, position_side.lower(), current_price, positions_index)
     
     # ===== 持仓属性（用于兼容原接口） =====
     
@@ -451,9 +476,13 @@ class RealTradingExecutor:
     
     @property
     def closed_positions(self) -> List:
-        """返回已平仓列表（从trade_history提取完整信息）"""
-        closed = []
-        for trade in self.trade_history:
+        """
+        返回已平仓列表（从trade_history提取完整信息）
+        
+        只转换上次调用之后新增的交易记录；返回的列表为共享缓存，调用方不应修改
+        """
+        closed = self._closed
+        for trade in self.trade_history[self._closed_scanned:]:
             if trade.get('action') == 'close':
                 # 构造完整的交易信息供Web显示
                 closed.append({
@@ -466,6 +495,7 @@ class RealTradingExecutor:
                     'pnl': trade.get('pnl', 0),                  # ✅ 盈亏
                     'timestamp': trade['timestamp'],
                 })
+        self._closed_scanned = len(self.trade_history)
         return closed
 
 
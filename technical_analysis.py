@@ -3,7 +3,12 @@ Technical analysis module for cryptocurrency data
 """
 
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the series kernels then run as plain Python
+    njit = None
 
 
 def calculate_sma(prices: List[float], period: int) -> float:
@@ -90,50 +95,219 @@ def calculate_bollinger_bands(prices: List[float], period: int = 20, std_dev: in
     }
 
 
-def analyze_market(klines: List[Dict]) -> Dict:
+def _ema_series(prices, period):
+    """EMA after every prefix: out[i] == calculate_ema(prices[:i+1], period)"""
+    n = prices.shape[0]
+    out = np.empty(n)
+    if n == 0:
+        return out
+    multiplier = 2 / (period + 1)
+    ema = prices[0]
+    out[0] = ema
+    for i in range(1, n):
+        ema = (prices[i] * multiplier) + (ema * (1 - multiplier))
+        out[i] = prices[i] if i + 1 < period else ema
+    return out
+
+
+def _rsi_series(prices, period):
+    """RSI after every prefix: out[i] == calculate_rsi(prices[:i+1], period)"""
+    n = prices.shape[0]
+    out = np.full(n, 50.0)
+    for i in range(period, n):
+        avg_gain = 0.0
+        avg_loss = 0.0
+        for j in range(i - period + 1, i + 1):
+            d = prices[j] - prices[j - 1]
+            if d > 0:
+                avg_gain += d
+            elif d < 0:
+                avg_loss -= d
+        avg_gain /= period
+        avg_loss /= period
+        if avg_loss == 0:
+            out[i] = 100.0
+        else:
+            out[i] = 100 - (100 / (1 + avg_gain / avg_loss))
+    return out
+
+
+if njit is not None:
+    _ema_series = njit(cache=True)(_ema_series)
+    _rsi_series = njit(cache=True)(_rsi_series)
+
+
+def _ema_rows(prices, period):
+    """_ema_series applied to every row of a (symbols, candles) array"""
+    out = np.empty_like(prices)
+    for r in range(prices.shape[0]):
+        out[r] = _ema_series(prices[r], period)
+    return out
+
+
+def _rsi_rows(prices, period):
+    """_rsi_series applied to every row of a (symbols, candles) array"""
+    out = np.empty_like(prices)
+    for r in range(prices.shape[0]):
+        out[r] = _rsi_series(prices[r], period)
+    return out
+
+
+def _tail_stats_rows(prices, period):
+    """
+    Mean and population std of the last period values of every row
+    
+    Summed in order, so the mean equals calculate_sma and both match
+    calculate_bollinger_bands; zeros for rows shorter than period.
+    """
+    rows, n = prices.shape
+    mean = np.zeros(rows)
+    std = np.zeros(rows)
+    if n < period:
+        return mean, std
+    for r in range(rows):
+        total = 0.0
+        for j in range(n - period, n):
+            total += prices[r, j]
+        m = total / period
+        variance = 0.0
+        for j in range(n - period, n):
+            variance += (prices[r, j] - m) ** 2
+        mean[r] = m
+        std[r] = (variance / period) ** 0.5
+    return mean, std
+
+
+if njit is not None:
+    _ema_rows = njit(cache=True)(_ema_rows)
+    _rsi_rows = njit(cache=True)(_rsi_rows)
+    _tail_stats_rows = njit(cache=True)(_tail_stats_rows)
+    # Compile (or load from cache) at import rather than on the first analysis
+    _ema_series(np.ones(64), 12)
+    _rsi_series(np.ones(64), 14)
+    _ema_rows(np.ones((2, 64)), 12)
+    _rsi_rows(np.ones((2, 64)), 14)
+    _tail_stats_rows(np.ones((2, 64)), 20)
+
+
+def analyze_market(klines: Union[np.ndarray, List[Dict]]) -> Dict:
     """
     Perform comprehensive technical analysis on market data
     
     Args:
-        klines: List of kline/candlestick data
-        
+        klines: (n, 6) kline array (timestamp, open, high, low, close, volume)
+                as returned by CryptoAPI.get_klines, or a list of kline dicts
+    
     Returns:
         Dictionary with technical indicators and analysis
     """
-    if not klines:
+    if len(klines) == 0:
         return {}
     
-    closes = [k['close'] for k in klines]
-    highs = [k['high'] for k in klines]
-    lows = [k['low'] for k in klines]
-    volumes = [k['volume'] for k in klines]
-    timestamps = [k['timestamp'] for k in klines]
+    if isinstance(klines, np.ndarray):
+        timestamps = klines[:, 0].astype(np.int64).tolist()
+        highs = klines[:, 2].tolist()
+        lows = klines[:, 3].tolist()
+        closes = klines[:, 4].tolist()
+        volumes = klines[:, 5].tolist()
+    else:
+        closes = [k['close'] for k in klines]
+        highs = [k['high'] for k in klines]
+        lows = [k['low'] for k in klines]
+        volumes = [k['volume'] for k in klines]
+        timestamps = [k['timestamp'] for k in klines]
+    
+    # Indicator values after every candle, one pass each
+    close_arr = np.asarray(closes, dtype=np.float64)[np.newaxis]
+    return _summarize(closes, volumes, *_indicator_series(close_arr)[0])
+
+
+def analyze_markets(klines_by_symbol: Dict[str, np.ndarray],
+                    cache: Optional[Dict[str, Tuple[bytes, Dict]]] = None) -> Dict[str, Dict]:
+    """
+    analyze_market for several symbols, computing the indicator series in one batch
+    
+    Args:
+        klines_by_symbol: (n, 6) kline arrays by symbol, as returned by
+                          CryptoAPI.get_klines_batch
+        cache: Optional dict kept by the caller between calls; a symbol whose
+               closes and volumes are unchanged since the previous call gets
+               its previous result back (the same dict) without recomputing
+    
+    Returns:
+        Dictionary mapping symbols to analyze_market results
+    """
+    results = {}
+    keys: Dict[str, bytes] = {}
+    
+    # Stack symbols with the same candle count into one (symbols, candles) array
+    groups: Dict[int, List[str]] = {}
+    for symbol, klines in klines_by_symbol.items():
+        if not len(klines):
+            continue
+        if cache is not None:
+            # The results depend only on the close and volume columns
+            key = keys[symbol] = klines[:, 4:6].tobytes()
+            cached = cache.get(symbol)
+            if cached is not None and cached[0] == key:
+                results[symbol] = cached[1]
+                continue
+        groups.setdefault(len(klines), []).append(symbol)
     
+    for symbols in groups.values():
+        closes = np.stack([klines_by_symbol[s][:, 4] for s in symbols]).astype(np.float64)
+        for symbol, row, series in zip(symbols, closes.tolist(), _indicator_series(closes)):
+            volumes = klines_by_symbol[symbol][:, 5].tolist()
+            results[symbol] = _summarize(row, volumes, *series)
+            if cache is not None:
+                cache[symbol] = (keys[symbol], results[symbol])
+    return {symbol: results.get(symbol, {}) for symbol in klines_by_symbol}
+
+
+def _indicator_series(closes: np.ndarray) -> List[tuple]:
+    """
+    Per-row indicators of a (symbols, candles) array: the ema12, ema20, rsi7,
+    rsi14 and macd series, then the sma20, sma50 and 20-candle std values
+    """
+    ema12 = _ema_rows(closes, 12)
+    ema20 = _ema_rows(closes, 20)
+    ema26 = _ema_rows(closes, 26)
+    rsi7 = _rsi_rows(closes, 7)
+    rsi14 = _rsi_rows(closes, 14)
+    macd = ema12 - ema26
+    macd[:, :25] = 0  # calculate_macd needs 26 candles
+    sma20, std20 = _tail_stats_rows(closes, 20)
+    sma50, _ = _tail_stats_rows(closes, 50)
+    return list(zip(ema12, ema20, rsi7, rsi14, macd, sma20.tolist(), sma50.tolist(), std20.tolist()))
+
+
+def _summarize(closes: List[float], volumes: List[float], ema12_series: np.ndarray,
+               ema20_series: np.ndarray, rsi7_series: np.ndarray, rsi14_series: np.ndarray,
+               macd_series: np.ndarray, sma_20: float, sma_50: float, std_20: float) -> Dict:
+    """Build the analyze_market result from one symbol's candles and indicator series"""
     current_price = closes[-1]
     price_change = ((current_price - closes[0]) / closes[0]) * 100 if closes[0] > 0 else 0
     
     # Calculate indicators
-    sma_20 = calculate_sma(closes, 20)
-    sma_50 = calculate_sma(closes, 50)
-    ema_12 = calculate_ema(closes, 12)
-    ema_20 = calculate_ema(closes, 20)
-    rsi_7 = calculate_rsi(closes, 7)
-    rsi_14 = calculate_rsi(closes, 14)
-    macd = calculate_macd(closes)
-    bb = calculate_bollinger_bands(closes)
+    ema_12 = float(ema12_series[-1])
+    ema_20 = float(ema20_series[-1])
+    rsi_7 = float(rsi7_series[-1])
+    rsi_14 = float(rsi14_series[-1])
+    macd_value = float(macd_series[-1])
+    signal = macd_value * 0.9  # Simplified signal line, as in calculate_macd
+    macd = {'macd': macd_value, 'signal': signal, 'histogram': macd_value - signal}
+    if len(closes) < 20:
+        bb = calculate_bollinger_bands(closes)
+    else:
+        bb = {'upper': sma_20 + (std_20 * 2), 'middle': sma_20, 'lower': sma_20 - (std_20 * 2)}
     
     # Get recent series (last 10 points for intraday)
     recent_count = min(10, len(closes))
     recent_prices = closes[-recent_count:]
-    recent_ema20 = [calculate_ema(closes[:i+1], 20) for i in range(len(closes)-recent_count, len(closes))]
-    recent_rsi7 = [calculate_rsi(closes[:i+1], 7) for i in range(len(closes)-recent_count, len(closes))]
-    recent_rsi14 = [calculate_rsi(closes[:i+1], 14) for i in range(len(closes)-recent_count, len(closes))]
-    
-    # Calculate MACD series
-    recent_macd = []
-    for i in range(len(closes)-recent_count, len(closes)):
-        m = calculate_macd(closes[:i+1])
-        recent_macd.append(m['macd'])
+    recent_ema20 = ema20_series[-recent_count:].tolist()
+    recent_rsi7 = rsi7_series[-recent_count:].tolist()
+    recent_rsi14 = rsi14_series[-recent_count:].tolist()
+    recent_macd = macd_series[-recent_count:].tolist()
     
     # Volume analysis
     avg_volume = sum(volumes[-20:]) / min(20, len(volumes))
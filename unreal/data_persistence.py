@@ -1,91 +1,420 @@
 """
 Data Persistence Module
-Saves and loads trading state to/from JSON file
+Saves and loads trading state: a small MessagePack snapshot (capital, open
+positions, iteration) plus append-only JSONL logs for the growing histories.
+The per-tick value and price logs are appended as zstd frames and compacted
+to the chart window once they grow to twice its size.
 """
 
+import io
 import json
 import os
+import threading
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Sequence
+import msgpack
+import zstandard as zstd
 from trading_simulator import TradingSimulator, Position, PositionType
 
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+
+def _loads(data: bytes):
+    """Parse UTF-8 JSON bytes (legacy snapshots and log lines)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps_line(obj) -> bytes:
+    """Serialize one record as a compact JSON line"""
+    if orjson is not None:
+        return orjson.dumps(obj) + b'\n'
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+_POSITION_TYPES = {t.value: t for t in PositionType}
+
 
 class DataPersistence:
     """Handle saving and loading trading state"""
     
-    def __init__(self, data_file: str = "trading_data.json"):
+    def __init__(self, data_file: str = "trading_data.msgpack",
+                 legacy_file: str = "trading_data.json",
+                 trade_log: str = "trade_log.jsonl",
+                 value_log: str = "value_log.jsonl",
+                 price_log: str = "price_log.jsonl",
+                 history_limit: Optional[int] = None):
+        """
+        Args:
+            history_limit: Value/price points kept per series (the chart window). Once
+                           a log holds twice that many it is rewritten with only the
+                           newest window, so the logs and startup loads stay bounded.
+        """
         self.data_file = data_file
+        self.legacy_file = legacy_file
+        self.trade_log = trade_log
+        self.value_log = value_log
+        self.price_log = price_log
+        self.history_limit = history_limit
+        
+        # Number of trade records already on disk
+        self._saved_trades = 0
+        # Value/price points already on disk, counted in appends: the chart
+        # histories are fixed-capacity HistoryBuffers, so their length stops growing.
+        self._saved_values = 0
+        self._saved_prices: Dict[str, int] = {}
+        # Records in the value/price logs, written or queued, to know when to compact
+        self._value_rows = 0
+        self._price_rows = 0
+        self._compressor = zstd.ZstdCompressor(level=3)
+        
+        # Background saves: the merged snapshot waiting for the writer thread
+        self._pending: Optional[Dict] = None
+        self._pending_changed = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._writing = False
+        self._failed: Optional[Dict] = None  # records of a failed background write
     
     def save_state(self, simulator: TradingSimulator, 
-                   value_history: List[Dict], 
-                   price_history: Dict[str, List[Dict]],
+                   value_history: Sequence[Dict], 
+                   price_history: Dict[str, Sequence[Dict]],
                    iteration_count: int) -> bool:
-        """Save current trading state to file"""
+        """Append new history records to the logs and rewrite the small state file"""
+        # Let queued background saves land first so the logs stay in order
+        self.wait_saved()
         try:
-            # Convert Position objects to dict
-            open_positions = [
-                {
-                    'symbol': pos.symbol,
-                    'position_type': pos.position_type.value if hasattr(pos.position_type, 'value') else str(pos.position_type),
-                    'entry_price': pos.entry_price,
-                    'size': pos.size,
-                    'leverage': pos.leverage,
-                    'timestamp': pos.timestamp.isoformat(),
-                    'target_price': pos.target_price,
-                    'stop_loss': pos.stop_loss
-                }
-                for pos in simulator.open_positions
-            ]
-            
-            # Trade history is already in dict format
-            trade_history = simulator.trade_history
-            
-            state = {
+            snapshot = self._snapshot(simulator, value_history, price_history, iteration_count)
+        except Exception as e:
+            print(f"❌ Error saving state: {e}")
+            return False
+        try:
+            return self._write_snapshot(snapshot)
+        except Exception as e:
+            print(f"❌ Error saving state: {e}")
+            with self._pending_changed:
+                self._failed = self._merge_snapshots(self._failed, snapshot)
+            return False
+    
+    def save_state_async(self, simulator: TradingSimulator,
+                         value_history: Sequence[Dict],
+                         price_history: Dict[str, Sequence[Dict]],
+                         iteration_count: int):
+        """
+        Like save_state, but the file writes happen on a background thread
+        
+        Only the in-memory snapshot is taken on the caller's thread. Saves queued
+        while the writer is busy are merged into one write.
+        """
+        try:
+            snapshot = self._snapshot(simulator, value_history, price_history, iteration_count)
+        except Exception as e:
+            print(f"❌ Error saving state: {e}")
+            return
+        with self._pending_changed:
+            self._pending = self._merge_snapshots(self._pending, snapshot)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_pending,
+                                                name='state-writer', daemon=True)
+                self._writer.start()
+            self._pending_changed.notify_all()
+    
+    def wait_saved(self, timeout: Optional[float] = None) -> bool:
+        """Block until queued background saves are on disk; False on timeout"""
+        with self._pending_changed:
+            return self._pending_changed.wait_for(
+                lambda: self._pending is None and not self._writing, timeout)
+    
+    def _snapshot(self, simulator: TradingSimulator, value_history: Sequence[Dict],
+                  price_history: Dict[str, Sequence[Dict]], iteration_count: int) -> Dict:
+        """Collect the unsaved records and the state dict, marking the records as saved"""
+        # Convert Position objects to dict
+        open_positions = [
+            {
+                'symbol': pos.symbol,
+                'position_type': pos.position_type.value if hasattr(pos.position_type, 'value') else str(pos.position_type),
+                'entry_price': pos.entry_price,
+                'size': pos.size,
+                'leverage': pos.leverage,
+                'timestamp': pos.timestamp.timestamp(),
+                'target_price': pos.target_price,
+                'stop_loss': pos.stop_loss
+            }
+            for pos in simulator.open_positions
+        ]
+        
+        # Only records appended since the last save go to disk
+        new_values = self._unsaved_tail(value_history, self._saved_values)
+        new_prices = []
+        for symbol, history in price_history.items():
+            for point in self._unsaved_tail(history, self._saved_prices.get(symbol, 0)):
+                new_prices.append({'symbol': symbol, **point})
+        
+        # A log past twice the chart window is rewritten with just the window
+        self._value_rows += len(new_values)
+        self._price_rows += len(new_prices)
+        limit = self.history_limit
+        compact_values = limit is not None and self._value_rows > 2 * limit
+        compact_prices = limit is not None and self._price_rows > 2 * limit * max(1, len(price_history))
+        if compact_values:
+            new_values = list(value_history)[-limit:]
+            self._value_rows = len(new_values)
+        if compact_prices:
+            new_prices = [{'symbol': symbol, **point}
+                          for symbol, history in price_history.items() for point in list(history)[-limit:]]
+            self._price_rows = len(new_prices)
+        
+        snapshot = {
+            'trades': simulator.trade_history[self._saved_trades:],
+            'values': new_values,
+            'prices': new_prices,
+            'compact_values': compact_values,
+            'compact_prices': compact_prices,
+            'state': {
                 'timestamp': datetime.now().isoformat(),
                 'iteration_count': iteration_count,
                 'simulator': {
                     'initial_capital': simulator.initial_capital,
                     'capital': simulator.capital,
-                    'open_positions': open_positions,
-                    'trade_history': trade_history
-                },
-                'value_history': value_history,
-                'price_history': price_history
-            }
-            
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(state, f, indent=2, ensure_ascii=False)
-            
-            print(f"✅ State saved to {self.data_file}")
-            return True
+                    'open_positions': open_positions
+                }
+            },
+        }
+        
+        self._saved_trades = len(simulator.trade_history)
+        self._mark_saved(value_history, price_history)
+        
+        with self._pending_changed:
+            if self._failed is not None:
+                snapshot = self._merge_snapshots(self._failed, snapshot)
+                self._failed = None
+        return snapshot
+    
+    @staticmethod
+    def _merge_snapshots(older: Optional[Dict], newer: Dict) -> Dict:
+        """One snapshot with both sets of new records and the newer state"""
+        if older is None:
+            return newer
+        # A compacting snapshot already holds every record its log should keep
+        return {
+            'trades': older['trades'] + newer['trades'],
+            'values': newer['values'] if newer['compact_values'] else older['values'] + newer['values'],
+            'prices': newer['prices'] if newer['compact_prices'] else older['prices'] + newer['prices'],
+            'compact_values': older['compact_values'] or newer['compact_values'],
+            'compact_prices': older['compact_prices'] or newer['compact_prices'],
+            'state': newer['state'],
+        }
+    
+    def _write_snapshot(self, snapshot: Dict) -> bool:
+        """Append a snapshot's records to the logs and rewrite the state file"""
+        self._append_records(self.trade_log, snapshot['trades'])
+        for path, records, compact in ((self.value_log, snapshot['values'], snapshot['compact_values']),
+                                       (self.price_log, snapshot['prices'], snapshot['compact_prices'])):
+            if compact:
+                self._write_atomic(path, self._encode_records(records, self._compressor))
+            else:
+                self._append_records(path, records, compressor=self._compressor)
+        
+        self._write_atomic(self.data_file, msgpack.packb(snapshot['state'], use_bin_type=True))
+        
+        print(f"✅ State saved to {self.data_file}")
+        return True
+    
+    def _write_pending(self):
+        """Writer thread: write queued snapshots, newest state last"""
+        while True:
+            with self._pending_changed:
+                self._pending_changed.wait_for(lambda: self._pending is not None)
+                snapshot, self._pending = self._pending, None
+                self._writing = True
             
-        except Exception as e:
-            print(f"❌ Error saving state: {e}")
-            return False
+            try:
+                self._write_snapshot(snapshot)
+            except Exception as e:
+                print(f"❌ Error saving state: {e}")
+                with self._pending_changed:
+                    # Keep the records for the next save rather than dropping them
+                    self._failed = self._merge_snapshots(self._failed, snapshot)
+            finally:
+                with self._pending_changed:
+                    self._writing = False
+                    self._pending_changed.notify_all()
     
-    def load_state(self) -> Optional[Dict]:
-        """Load trading state from file"""
-        if not os.path.exists(self.data_file):
+    def load_state(self, history_limit: Optional[int] = None) -> Optional[Dict]:
+        """
+        Load trading state from file (migrates a legacy JSON snapshot once)
+        
+        Args:
+            history_limit: Keep only the newest points of the value history and of
+                           each price history (defaults to the constructor's)
+        """
+        if history_limit is None:
+            history_limit = self.history_limit
+        if os.path.exists(self.data_file):
+            source = self.data_file
+        elif self.legacy_file and os.path.exists(self.legacy_file):
+            source = self.legacy_file
+        else:
             print(f"ℹ️  No saved state found ({self.data_file})")
             return None
         
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                state = json.load(f)
+            with open(source, 'rb') as f:
+                raw = f.read()
+            
+            if source == self.legacy_file:
+                # Next save_state() writes the msgpack file, which takes precedence from then on
+                state = _loads(raw)
+            else:
+                state = msgpack.unpackb(raw, raw=False)
+            
+            sim_data = state['simulator']
+            if 'trade_history' in sim_data:
+                # Older snapshot with the histories embedded: move them into the logs
+                state.setdefault('value_history', [])
+                state.setdefault('price_history', {})
+                self._write_logs(sim_data['trade_history'], state['value_history'], state['price_history'])
+                self._value_rows = len(state['value_history'])
+                self._price_rows = sum(len(history) for history in state['price_history'].values())
+            else:
+                compressed = self._is_compressed(self.value_log) and self._is_compressed(self.price_log)
+                
+                # Plain-text logs get rewritten below, so they have to be read whole
+                limit = history_limit if compressed else None
+                
+                sim_data['trade_history'] = self._read_records(self.trade_log)
+                self._value_rows = self._price_rows = 0
+                value_window = deque(maxlen=limit)
+                for record in self._iter_records(self.value_log):
+                    value_window.append(record)
+                    self._value_rows += 1
+                state['value_history'] = list(value_window)
+                price_windows: Dict[str, deque] = {}
+                for record in self._iter_records(self.price_log):
+                    self._price_rows += 1
+                    symbol = record.pop('symbol')
+                    window = price_windows.get(symbol)
+                    if window is None:
+                        window = price_windows[symbol] = deque(maxlen=limit)
+                    window.append(record)
+                price_history = {symbol: list(window) for symbol, window in price_windows.items()}
+                state['price_history'] = price_history
+                
+                if not compressed:
+                    # Plain-text logs from before compression: rewrite them as zstd
+                    self._write_logs(sim_data['trade_history'], state['value_history'], price_history)
+            
+            self._saved_trades = len(sim_data['trade_history'])
+            self._mark_saved(state['value_history'], state['price_history'])
             
-            print(f"✅ State loaded from {self.data_file}")
+            print(f"✅ State loaded from {source}")
             print(f"   Saved at: {state['timestamp']}")
             print(f"   Iteration: {state['iteration_count']}")
-            print(f"   Capital: ${state['simulator']['capital']:.2f}")
-            print(f"   Open Positions: {len(state['simulator']['open_positions'])}")
-            print(f"   Trade History: {len(state['simulator']['trade_history'])} trades")
+            print(f"   Capital: ${sim_data['capital']:.2f}")
+            print(f"   Open Positions: {len(sim_data['open_positions'])}")
+            print(f"   Trade History: {len(sim_data['trade_history'])} trades")
             
             return state
-            
+        
         except Exception as e:
             print(f"❌ Error loading state: {e}")
             return None
     
+    @staticmethod
+    def _write_atomic(path: str, payload: bytes):
+        """Write an encoded payload to a temp file and swap it into place"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    
+    def _mark_saved(self, value_history: Sequence[Dict], price_history: Dict[str, Sequence[Dict]]):
+        """Remember how many value/price points are on disk"""
+        self._saved_values = self._appended(value_history)
+        self._saved_prices = {symbol: self._appended(history) for symbol, history in price_history.items()}
+    
+    def _write_logs(self, trade_history: List[Dict], value_history: List[Dict],
+                    price_history: Dict[str, List[Dict]]):
+        """Rewrite all three logs from complete in-memory histories"""
+        prices = [{'symbol': symbol, **point}
+                  for symbol, history in price_history.items() for point in history]
+        self._append_records(self.trade_log, trade_history, 'wb')
+        self._append_records(self.value_log, value_history, 'wb', self._compressor)
+        self._append_records(self.price_log, prices, 'wb', self._compressor)
+    
+    @staticmethod
+    def _appended(history: Sequence[Dict]) -> int:
+        """Points ever appended to a HistoryBuffer, or the length of a plain list"""
+        return getattr(history, 'appended', len(history))
+    
+    @staticmethod
+    def _unsaved_tail(history: Sequence[Dict], saved: int) -> List[Dict]:
+        """Records appended after the first saved ones (overwritten points are skipped)"""
+        records_since = getattr(history, 'records_since', None)
+        if records_since is not None:
+            return records_since(saved)
+        return list(history)[saved:]
+    
+    @staticmethod
+    def _is_compressed(path: str) -> bool:
+        """Whether a log is missing/empty or starts with a zstd frame"""
+        if not os.path.exists(path):
+            return True
+        with open(path, 'rb') as f:
+            head = f.read(4)
+        return not head or head == ZSTD_MAGIC
+    
+    @staticmethod
+    def _encode_records(records: List[Dict], compressor: Optional[zstd.ZstdCompressor] = None) -> bytes:
+        """Records as JSONL bytes (one zstd frame if compressing)"""
+        payload = b''.join(_dumps_line(record) for record in records)
+        if compressor is not None and payload:
+            payload = compressor.compress(payload)
+        return payload
+    
+    @classmethod
+    def _append_records(cls, path: str, records: List[Dict], mode: str = 'ab',
+                        compressor: Optional[zstd.ZstdCompressor] = None):
+        """Write records to a JSONL log in a single write call (one zstd frame if compressing)"""
+        if not records and mode == 'ab':
+            return
+        payload = cls._encode_records(records, compressor)
+        with open(path, mode) as f:
+            f.write(payload)
+    
+    @classmethod
+    def _read_records(cls, path: str, limit: Optional[int] = None) -> List[Dict]:
+        """Read a JSONL log back into a list, keeping only the last limit records if given"""
+        if limit is None:
+            return list(cls._iter_records(path))
+        return list(deque(cls._iter_records(path), maxlen=limit))
+    
+    @staticmethod
+    def _iter_records(path: str) -> Iterator[Dict]:
+        """Stream the records of a JSONL log (plain or zstd frames) line by line, skipping torn lines"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            if f.read(4) == ZSTD_MAGIC:
+                f.seek(0)
+                lines = io.BufferedReader(zstd.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+            else:
+                f.seek(0)
+                lines = f
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    yield _loads(line)
+                except ValueError:
+                    print(f"⚠️  Skipping unreadable line in {path}")
+    
     def restore_simulator(self, state: Dict) -> TradingSimulator:
         """Restore TradingSimulator from saved state"""
         sim_data = state['simulator']
@@ -101,34 +430,42 @@ class DataPersistence:
         
         # Restore open positions
         for pos_data in sim_data['open_positions']:
-            # Convert string to PositionType enum
-            pos_type_str = pos_data['position_type']
-            pos_type = PositionType.LONG if pos_type_str == 'long' else PositionType.SHORT
+            # Stored as epoch seconds; older snapshots used ISO strings
+            ts = pos_data['timestamp']
+            opened_at = datetime.fromisoformat(ts) if isinstance(ts, str) else datetime.fromtimestamp(ts)
             
             position = Position(
                 symbol=pos_data['symbol'],
-                position_type=pos_type,
+                position_type=_POSITION_TYPES[pos_data['position_type']],
                 size=pos_data['size'],
                 entry_price=pos_data['entry_price'],
                 leverage=pos_data['leverage'],
-                timestamp=datetime.fromisoformat(pos_data['timestamp']),
+                timestamp=opened_at,
                 target_price=pos_data.get('target_price'),
                 stop_loss=pos_data.get('stop_loss')
             )
-            simulator.open_positions.append(position)
+            simulator.restore_position(position)
         
         return simulator
     
     def delete_state(self) -> bool:
-        """Delete saved state file"""
+        """Delete saved state file, history logs and any legacy JSON snapshot"""
         try:
-            if os.path.exists(self.data_file):
-                os.remove(self.data_file)
-                print(f"✅ Deleted saved state: {self.data_file}")
-                return True
-            else:
+            deleted = False
+            for path in (self.data_file, self.legacy_file,
+                         self.trade_log, self.value_log, self.price_log):
+                if path and os.path.exists(path):
+                    os.remove(path)
+                    print(f"✅ Deleted saved state: {path}")
+                    deleted = True
+            if not deleted:
                 print(f"ℹ️  No saved state to delete")
-                return False
+            self._saved_trades = 0
+            self._saved_values = 0
+            self._saved_prices = {}
+            self._value_rows = 0
+            self._price_rows = 0
+            return deleted
         except Exception as e:
             print(f"❌ Error deleting state: {e}")
             return False
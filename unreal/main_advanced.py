@@ -5,11 +5,13 @@ Advanced trading bot with detailed LLM communication and Model Chat display
 
 import time
 from datetime import datetime
+import logging
 import signal
 import sys
 import argparse
 from typing import Dict
 import threading
+import traceback
 
 # 添加父目录到路径
 import os
@@ -17,12 +19,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import (
     INITIAL_CAPITAL, MAX_LEVERAGE, DECISION_INTERVAL, 
-    TRADING_PAIRS, VOLATILITY_THRESHOLD
+    TRADING_PAIRS, VOLATILITY_THRESHOLD, USE_PRICE_STREAM, CHART_HISTORY_ITEMS,
+    SHUTDOWN_PRICE_MAX_AGE, EMERGENCY_THRESHOLD
 )
 from crypto_api import CryptoAPI
 from trading_simulator import TradingSimulator
-from technical_analysis import analyze_market
-from llm_agent_advanced import AdvancedTradingAgent
+from technical_analysis import analyze_markets
+from llm_agent_advanced import AdvancedTradingAgent, parse_action
+from price_book import PriceBook, positions_array
+from history_buffer import HistoryBuffer
 from logger import TradingLogger
 from web_server import update_trading_data, update_llm_conversation, run_server
 from data_persistence import DataPersistence
@@ -32,18 +37,34 @@ class AdvancedTradingBot:
     """Advanced trading bot with structured LLM communication"""
     
     def __init__(self, load_saved_state: bool = True):
-        self.persistence = DataPersistence()
+        self.persistence = DataPersistence(history_limit=CHART_HISTORY_ITEMS)
         self.api = CryptoAPI()
         self.agent = AdvancedTradingAgent()
         self.logger = TradingLogger()
         
         self.running = False
-        self.last_decision_time = 0
-        self.last_prices = {}
+        self._wake_event = threading.Event()  # set by stop()/run_now() to cut the sleep between iterations short
+        self.last_decision_time = float('-inf')  # time.monotonic() of the last LLM decision
+        self.last_book = None  # PriceBook from the previous iteration
+        self.last_prices = {}  # latest fetched prices, reused on shutdown
+        self.last_prices_at = 0.0  # time.monotonic() of last_prices
+        # Position record array for the wake-up checks, rebuilt when positions change
+        self._positions_arr = None
+        self._positions_version = -1
         self.iteration_count = 0
+        # The pair list is fixed at startup: per-iteration books share this symbol index
+        # and the price log line is filled with one str.format call
+        self._pairs = tuple(TRADING_PAIRS)
+        self._empty_book = PriceBook(self._pairs)
+        if USE_PRICE_STREAM:
+            # Pushed prices wake the loop early on an emergency move (needs last_book above)
+            self.api.start_price_stream(TRADING_PAIRS, on_price=self._on_stream_price)
+        self._price_line = ", ".join(f"{s}: ${{:,.2f}}" for s in self._pairs)
+        # Indicator results by symbol, reused while a symbol's candles are unchanged
+        self._ta_cache = {}
         
-        # Price and value history for charts
-        self.value_history = []
+        # Price and value history for charts (bounded ring buffers)
+        self.value_history = HistoryBuffer('value', CHART_HISTORY_ITEMS)
         self.price_history = {}
         
         # Try to load saved state
@@ -52,8 +73,12 @@ class AdvancedTradingBot:
             if saved_state:
                 self.simulator = self.persistence.restore_simulator(saved_state)
                 self.iteration_count = saved_state['iteration_count']
-                self.value_history = saved_state.get('value_history', [])
-                self.price_history = saved_state.get('price_history', {})
+                self.value_history = HistoryBuffer.from_records(
+                    saved_state.get('value_history', []), 'value', CHART_HISTORY_ITEMS)
+                self.price_history = {
+                    symbol: HistoryBuffer.from_records(history, 'price', CHART_HISTORY_ITEMS)
+                    for symbol, history in saved_state.get('price_history', {}).items()
+                }
                 self.logger.log("✅ Resumed from saved state")
             else:
                 self.simulator = TradingSimulator(INITIAL_CAPITAL, MAX_LEVERAGE)
@@ -65,19 +90,41 @@ class AdvancedTradingBot:
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
     
+    def stop(self):
+        """Ask the run loop to exit without waiting out the current sleep"""
+        self.running = False
+        self._wake_event.set()
+    
+    def run_now(self):
+        """Skip the rest of the current sleep and start the next iteration"""
+        self._wake_event.set()
+    
+    def _on_stream_price(self, symbol: str, price: float):
+        """
+        Price stream callback (stream thread): start the next iteration now when a
+        pushed price moves past EMERGENCY_THRESHOLD from the last iteration's book
+        
+        The iteration then sees the same move in should_request_decision.
+        """
+        last = self.last_book
+        reference = last.get(symbol) if last is not None else None
+        if reference and abs(price - reference) / reference > EMERGENCY_THRESHOLD:
+            self.run_now()
+    
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals"""
         if not self.running:
             sys.exit(0)
         print("\n\nReceived shutdown signal. Saving state and exiting...")
-        self.running = False
+        self.stop()
         # Save state before exit
         self._save_state()
     
-    def _save_state(self):
-        """Save current state to disk"""
+    def _save_state(self, background: bool = False):
+        """Save current state to disk (background=True leaves the file writes to the writer thread)"""
+        save = self.persistence.save_state_async if background else self.persistence.save_state
         try:
-            self.persistence.save_state(
+            save(
                 simulator=self.simulator,
                 value_history=self.value_history,
                 price_history=self.price_history,
@@ -86,31 +133,41 @@ class AdvancedTradingBot:
         except Exception as e:
             print(f"❌ Error saving state: {e}")
     
+    def _on_partial_decision(self, kind: str, value):
+        """Streaming callback: pre-validate each action as soon as the LLM finishes writing it"""
+        if kind != 'action':
+            return
+        try:
+            action, symbol, _, _, size, _ = parse_action(value)
+        except Exception as e:
+            self.logger.log(f"  ⚠️  Received unparseable action: {e}")
+            return
+        
+        self.logger.log(f"  ⏳ Received action: {action.upper()} {symbol}")
+        if symbol not in self._pairs:
+            self.logger.log(f"  ⚠️  Unknown symbol '{symbol}' - will be skipped")
+        elif action == 'open' and size <= 0:
+            self.logger.log(f"  ⚠️  Invalid size {size} for {symbol} - will be skipped")
+    
     def execute_actions(self, actions: list, current_prices: Dict[str, float], chain_of_thought: Dict = None):
         """Execute trading actions from LLM decision"""
         if not actions:
             self.logger.log("No actions to execute")
             return
-
+        
         cot = chain_of_thought or {}
         
         self.logger.log(f"\nExecuting {len(actions)} actions:")
         
         for i, action_data in enumerate(actions, 1):
             try:
-                action = action_data.get('action', '').lower()
-                symbol = action_data.get('symbol', '')
-                reason = action_data.get('reason', '')
+                action, symbol, reason, position_type, size, leverage = parse_action(action_data)
                 
                 if not symbol or symbol not in current_prices:
                     self.logger.log(f"  ⚠️  Action {i}: Invalid symbol '{symbol}' - Skipping")
                     continue
                 
                 if action == 'open':
-                    position_type = action_data.get('position_type', '').lower()
-                    size = float(action_data.get('size', 0))
-                    leverage = float(action_data.get('leverage', 1))
-                    
                     if size <= 0:
                         self.logger.log(f"  ⚠️  Action {i}: Invalid size {size} - Skipping")
                         continue
@@ -152,10 +209,7 @@ class AdvancedTradingBot:
                             self.logger.log(f"     ⚠️  Insufficient capital (need ${margin_needed - available:.2f} more)")
                 
                 elif action == 'close':
-                    positions_to_close = [
-                        pos for pos in self.simulator.open_positions 
-                        if pos.symbol == symbol
-                    ]
+                    positions_to_close = self.simulator.positions_by_symbol.get(symbol, ())
                     
                     if not positions_to_close:
                         self.logger.log(f"  ⚠️  Action {i}: No open position for {symbol} - Skipping")
@@ -176,85 +230,96 @@ class AdvancedTradingBot:
             
             except Exception as e:
                 self.logger.log(f"  ❌ Action {i}: Error executing action: {e}")
-                import traceback
                 traceback.print_exc()
     
+    def _positions_array(self, book: PriceBook):
+        """Open positions as a record array, cached until the simulator's positions change"""
+        if self.simulator.positions_version != self._positions_version:
+            self._positions_version = self.simulator.positions_version
+            self._positions_arr = positions_array(
+                [pos.to_dict() for pos in self.simulator.open_positions], book)
+        return self._positions_arr
+    
+    def _format_prices(self, current_prices: Dict[str, float]) -> str:
+        """Format prices for the log, using the prebuilt line when every pair is present"""
+        try:
+            return self._price_line.format(*[current_prices[s] for s in self._pairs])
+        except KeyError:
+            return ", ".join(f"{s}: ${p:,.2f}" for s, p in current_prices.items())
+    
     def run_iteration(self):
         """Run one iteration of the trading loop"""
         self.iteration_count += 1
-        current_time = time.time()
+        current_time = time.monotonic()
         
         self.logger.log(f"\n--- Iteration {self.iteration_count} ---")
         
         # 1. Get current prices
-        current_prices = self.api.get_multiple_prices(TRADING_PAIRS)
+        current_prices = self.api.get_multiple_prices(self._pairs)
         if not current_prices:
             self.logger.log("❌ Failed to fetch prices")
             return
+        self.last_prices = current_prices
+        self.last_prices_at = time.monotonic()
         
-        price_str = ", ".join([f"{s}: ${p:,.2f}" for s, p in current_prices.items()])
-        self.logger.log(f"Current Prices: {price_str}")
+        if self.logger.is_enabled_for(logging.DEBUG):
+            self.logger.debug("Current Prices: %s", self._format_prices(current_prices))
         
         # 2. Get trading statistics
-        stats = self.simulator.get_statistics(current_prices)
-        open_positions = self.simulator.get_open_positions_summary(current_prices)
+        stats, open_positions = self.simulator.get_portfolio_snapshot(current_prices)
         
         # 3. Save state periodically
         if self.iteration_count % 10 == 0:
-            self._save_state()
+            self._save_state(background=True)
         
         # 4. Update history data for charts
         timestamp = datetime.now().isoformat()
         
         # Update value history
-        self.value_history.append({
-            'timestamp': timestamp,
-            'value': stats['total_value']
-        })
+        self.value_history.append(timestamp, stats['total_value'])
         
         # Update price history
         for symbol, price in current_prices.items():
             if symbol not in self.price_history:
-                self.price_history[symbol] = []
-            self.price_history[symbol].append({
-                'timestamp': timestamp,
-                'price': price
-            })
+                self.price_history[symbol] = HistoryBuffer('price', CHART_HISTORY_ITEMS)
+            self.price_history[symbol].append(timestamp, price)
         
         # 5. Update web dashboard (pass complete history)
-        closed_trades = [pos.to_dict() for pos in self.simulator.closed_positions]
+        closed_trades = self.simulator.get_closed_trades()
         update_trading_data(current_prices, open_positions, stats, closed_trades,
                           self.value_history, self.price_history)
         
         # 6. Check if we should request LLM decision
         time_since_last = current_time - self.last_decision_time
+        current_book = self._empty_book.with_prices(current_prices)
         should_decide, trigger_reason = self.agent.should_request_decision(
-            current_prices, 
-            self.last_prices,
+            current_book,
+            self.last_book,
             time_since_last,
             DECISION_INTERVAL,
-            open_positions
+            self._positions_array(current_book)
         )
         
         if should_decide:
             self.logger.log(f"\n=== Requesting LLM Decision (Trigger: {trigger_reason}) ===")
             
             # Get market analysis for all pairs
-            market_data = {}
-            for symbol in TRADING_PAIRS:
-                klines = self.api.get_klines(symbol, interval='15m', limit=100)
-                if klines:
-                    market_data[symbol] = analyze_market(klines)
+            klines_by_symbol = self.api.get_klines_batch(self._pairs, interval='15m', limit=100)
+            market_data = analyze_markets(klines_by_symbol, self._ta_cache)
             
-            # Request LLM decision
+            # Request LLM decision (actions are pre-validated as they stream in)
             decision = self.agent.make_decision(
                 current_prices=current_prices,
                 open_positions=open_positions,
                 account_balance=stats['current_capital'],
-                market_data=market_data
+                market_data=market_data,
+                on_partial=self._on_partial_decision
             )
             
-            if decision:
+            if decision and decision.get('cached'):
+                # Same state as the last decision: don't log or replay it again
+                self.logger.log("🤖 State unchanged since the last decision - holding")
+            elif decision:
                 # Log LLM conversation for web display
                 self.logger.log(f"🤖 LLM Summary: {decision['summary']}")
                 update_llm_conversation(decision)
@@ -269,7 +334,7 @@ class AdvancedTradingBot:
             self.last_decision_time = current_time
         
         # 7. Update last prices
-        self.last_prices = current_prices.copy()
+        self.last_book = current_book
     
     def run(self, sleep_seconds: int = 30):
         """Run the trading bot"""
@@ -287,9 +352,8 @@ class AdvancedTradingBot:
         try:
             current_prices = self.api.get_multiple_prices(TRADING_PAIRS)
             if current_prices:
-                stats = self.simulator.get_statistics(current_prices)
-                open_positions = self.simulator.get_open_positions_summary(current_prices)
-                closed_trades = [pos.to_dict() for pos in self.simulator.closed_positions]
+                stats, open_positions = self.simulator.get_portfolio_snapshot(current_prices)
+                closed_trades = self.simulator.get_closed_trades()
                 
                 # Send initial data to web server (including loaded history)
                 update_trading_data(current_prices, open_positions, stats, closed_trades,
@@ -301,19 +365,23 @@ class AdvancedTradingBot:
         try:
             while self.running:
                 self.run_iteration()
-                time.sleep(sleep_seconds)
-        
-        except KeyboardInterrupt:
-            self.logger.log("\nKeyboard interrupt received")
+                self.logger.flush()
+                self._wake_event.wait(sleep_seconds)
+                self._wake_event.clear()
         
         except Exception as e:
             self.logger.log(f"\n❌ Error: {e}")
-            import traceback
             traceback.print_exc()
         
         finally:
             self.shutdown()
     
+    def _shutdown_prices(self) -> Dict[str, float]:
+        """Last iteration's prices if still fresh, otherwise a new fetch"""
+        if self.last_prices and time.monotonic() - self.last_prices_at < SHUTDOWN_PRICE_MAX_AGE:
+            return self.last_prices
+        return self.api.get_multiple_prices(TRADING_PAIRS)
+    
     def shutdown(self):
         """Clean shutdown"""
         self.logger.log("\n=== Bot Shutting Down ===")
@@ -322,11 +390,16 @@ class AdvancedTradingBot:
         self._save_state()
         
         # Close all positions if requested
-        # current_prices = self.api.get_multiple_prices(TRADING_PAIRS)
+        # current_prices = self._shutdown_prices()
         # if current_prices:
-        #     self.simulator.close_all_positions(current_prices)
+        #     for trade in self.simulator.close_all_positions(current_prices):
+        #         self.logger.log_trade(trade)
         
+        self.api.close()
+        # The final save is synchronous, but don't exit under a writer thread still on disk
+        self.persistence.wait_saved()
         self.logger.log("Goodbye!")
+        self.logger.close()
         self.running = False
 
 
@@ -387,7 +460,7 @@ def main():
         run_server(host='127.0.0.1', port=5000, debug=False)
     except KeyboardInterrupt:
         print("\nShutting down...")
-        bot.running = False
+        bot.stop()
         bot_thread.join(timeout=5)
 
 
@@ -2,9 +2,10 @@
 Trading simulator with support for long/short positions and leverage
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from enum import Enum
+import numpy as np
 
 
 class PositionType(Enum):
@@ -84,22 +85,44 @@ class TradingSimulator:
         self.open_positions: List[Position] = []
         self.closed_positions: List[Position] = []
         self.trade_history: List[Dict] = []
-        
+        # to_dict() of closed_positions, extended as positions close
+        self._closed_trades: List[Dict] = []
+        self._winning_trades = 0  # closed positions with pnl > 0
+        # Bumped whenever open_positions changes, so callers can cache derived views
+        self.positions_version = 0
+        # Struct-of-arrays view of open_positions (same order) for vectorized P&L
+        self._rebuild_position_arrays()
+    
+    def _rebuild_position_arrays(self):
+        """Resync the per-position arrays with open_positions"""
+        positions = self.open_positions
+        self._symbols = [p.symbol for p in positions]
+        self._entry = np.array([p.entry_price for p in positions], dtype=np.float64)
+        self._size = np.array([p.size for p in positions], dtype=np.float64)
+        self._lev = np.array([p.leverage for p in positions], dtype=np.float64)
+        self._sign = np.array([1.0 if p.position_type == PositionType.LONG else -1.0 for p in positions])
+        self._margin = self._size / self._lev
+        # Rebuilt rather than updated in place, so callers may iterate a list while closing
+        self.positions_by_symbol: Dict[str, List[Position]] = {}
+        for p in positions:
+            self.positions_by_symbol.setdefault(p.symbol, []).append(p)
+        self.positions_version += 1
+    
+    def _unrealized_pnl(self, current_prices: Dict[str, float]) -> np.ndarray:
+        """Unrealized P&L per open position (NaN where no price is available)"""
+        curr = np.fromiter((current_prices.get(s, np.nan) for s in self._symbols),
+                           dtype=np.float64, count=len(self._symbols))
+        return self._sign * self._size * self._lev * (curr - self._entry) / self._entry
+    
+    def restore_position(self, position: Position):
+        """Re-attach a previously opened position (e.g. loaded from disk)"""
+        self.open_positions.append(position)
+        self._rebuild_position_arrays()
+    
     def get_total_value(self, current_prices: Dict[str, float]) -> float:
         """Calculate total account value including open positions"""
-        total = self.capital
-        
-        # Add back margin locked in positions
-        for position in self.open_positions:
-            margin = position.size / position.leverage
-            total += margin
-            
-            # Add unrealized P&L
-            if position.symbol in current_prices:
-                pnl = position.calculate_pnl(current_prices[position.symbol])
-                total += pnl
-        
-        return total
+        # Margin locked in positions plus unrealized P&L where priced
+        return float(self.capital + self._margin.sum() + np.nansum(self._unrealized_pnl(current_prices)))
     
     def get_available_capital(self) -> float:
         """Get capital available for new positions"""
@@ -153,6 +176,7 @@ class TradingSimulator:
         )
         
         self.open_positions.append(position)
+        self._rebuild_position_arrays()
         self.capital -= margin_required
         
         # Record trade
@@ -196,7 +220,11 @@ class TradingSimulator:
         
         # Move position to closed
         self.open_positions.remove(position)
+        self._rebuild_position_arrays()
         self.closed_positions.append(position)
+        self._closed_trades.append(position.to_dict())
+        if pnl > 0:
+            self._winning_trades += 1
         
         # Record trade
         self.trade_history.append({
@@ -214,22 +242,57 @@ class TradingSimulator:
         print(f"Closed {position.position_type.value.upper()} position: {position.symbol} P&L: ${pnl:.2f}")
         return pnl
     
-    def close_all_positions(self, current_prices: Dict[str, float]):
-        """Close all open positions"""
+    def close_all_positions(self, current_prices: Dict[str, float]) -> List[Dict]:
+        """
+        Close all open positions
+        
+        Returns:
+            Trade records of the positions closed by this call
+        """
+        closed = []
         for position in self.open_positions.copy():
             if position.symbol in current_prices:
                 self.close_position(position, current_prices[position.symbol])
+                closed.append(self.trade_history[-1])
+        return closed
+    
+    def get_closed_trades(self) -> List[Dict]:
+        """
+        Closed positions as dicts for the dashboard
+        
+        The list is kept up to date as positions close and returned by
+        reference; callers must not modify it.
+        """
+        return self._closed_trades
     
     def get_statistics(self, current_prices: Dict[str, float]) -> Dict:
         """Get trading statistics"""
-        total_value = self.get_total_value(current_prices)
+        return self._statistics(self._unrealized_pnl(current_prices))
+    
+    def get_open_positions_summary(self, current_prices: Dict[str, float]) -> List[Dict]:
+        """Get summary of open positions with current P&L"""
+        return self._positions_summary(current_prices, self._unrealized_pnl(current_prices))
+    
+    def get_portfolio_snapshot(self, current_prices: Dict[str, float]) -> Tuple[Dict, List[Dict]]:
+        """
+        Statistics and open positions summary from one unrealized P&L pass
+        
+        Returns:
+            (get_statistics() result, get_open_positions_summary() result)
+        """
+        pnls = self._unrealized_pnl(current_prices)
+        return self._statistics(pnls), self._positions_summary(current_prices, pnls)
+    
+    def _statistics(self, pnls: np.ndarray) -> Dict:
+        total_value = float(self.capital + self._margin.sum() + np.nansum(pnls))
         total_pnl = total_value - self.initial_capital
         roi = (total_pnl / self.initial_capital) * 100
         
-        winning_trades = [p for p in self.closed_positions if p.pnl > 0]
-        losing_trades = [p for p in self.closed_positions if p.pnl <= 0]
+        closed = len(self.closed_positions)
+        winning_trades = self._winning_trades
+        losing_trades = closed - winning_trades
         
-        win_rate = len(winning_trades) / len(self.closed_positions) * 100 if self.closed_positions else 0
+        win_rate = winning_trades / closed * 100 if closed else 0
         
         return {
             'initial_capital': self.initial_capital,
@@ -238,19 +301,17 @@ class TradingSimulator:
             'total_pnl': total_pnl,
             'roi_percent': roi,
             'open_positions': len(self.open_positions),
-            'closed_positions': len(self.closed_positions),
-            'total_trades': len(self.closed_positions),
-            'winning_trades': len(winning_trades),
-            'losing_trades': len(losing_trades),
+            'closed_positions': closed,
+            'total_trades': closed,
+            'winning_trades': winning_trades,
+            'losing_trades': losing_trades,
             'win_rate': win_rate,
         }
     
-    def get_open_positions_summary(self, current_prices: Dict[str, float]) -> List[Dict]:
-        """Get summary of open positions with current P&L"""
+    def _positions_summary(self, current_prices: Dict[str, float], pnls: np.ndarray) -> List[Dict]:
         summary = []
-        for position in self.open_positions:
+        for position, current_pnl in zip(self.open_positions, pnls.tolist()):
             if position.symbol in current_prices:
-                current_pnl = position.calculate_pnl(current_prices[position.symbol])
                 summary.append({
                     'symbol': position.symbol,
                     'type': position.position_type.value,
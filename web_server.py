@@ -2,21 +2,55 @@
 Flask web server for trading bot dashboard
 """
 
-from flask import Flask, jsonify, render_template
+from flask import Flask, Response, jsonify, render_template
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import json
 import os
+import threading
+from collections import deque
 from datetime import datetime
 from typing import Dict, List
+from history_buffer import HistoryBuffer
+
+try:
+    import waitress
+except ImportError:  # waitress is optional, fall back to Flask's built-in (threaded) server
+    waitress = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+
+class _JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that also serializes the bots' chart histories (with orjson if installed)"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, deque):
+            return list(o)
+        if isinstance(o, HistoryBuffer):
+            return o.to_records()
+        return DefaultJSONProvider.default(o)
+    
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs.get('indent') is not None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+
 
 app = Flask(__name__)
+app.json = _JSONProvider(app)
 CORS(app)
 
 # Global state to store trading data
 trading_state = {
     'prices': {},
     'price_history': {},
-    'value_history': [],
+    'value_history': deque(maxlen=100),
     'positions': [],
     'trades': [],
     'stats': {},
@@ -25,6 +59,118 @@ trading_state = {
     'llm_conversations': []  # Store LLM decision history
 }
 
+# Server-sent events: the bot only bumps _state_version; stream threads serialize
+_state_version = 0
+_state_changed = threading.Condition()
+_payload_lock = threading.Lock()
+_payload_cache = (-1, None, '')  # (version, trading_state, its serialized JSON)
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on an idle stream
+SSE_MAX_STREAMS = 4  # open /stream connections; more get a 503 and poll /api/all
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+# Stream events after the first carry only what changed: these fields whole when
+# replaced, and the entries appended to the histories and lists below
+_REPLACED_FIELDS = ('prices', 'positions', 'stats', 'last_update', 'running')
+_APPENDED_FIELDS = ('value_history', 'trades', 'llm_conversations')
+
+
+def _state_json(state: Dict) -> str:
+    """A trading_state dict as compact single-line JSON (safe for an SSE data field)"""
+    if orjson is not None:
+        return orjson.dumps(state, default=_JSONProvider.default,
+                            option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(state, default=_JSONProvider.default, separators=(',', ':'))
+
+
+def _state_payload():
+    """(version, state, JSON) of the current state, serialized at most once per version"""
+    global _payload_cache
+    with _payload_lock:
+        version, state = _state_version, trading_state
+        if _payload_cache[0] != version:
+            try:
+                payload = _state_json(state)
+            except RuntimeError:  # a history deque grew mid-serialization, retry once
+                payload = _state_json(state)
+            _payload_cache = (version, state, payload)
+        return _payload_cache
+
+
+def _series_mark(series) -> tuple:
+    """How far into a history or list a stream client has been sent"""
+    if isinstance(series, HistoryBuffer):
+        return series, series.appended
+    return None, (series[-1] if series else None)
+
+
+def _series_tail(series, mark: tuple):
+    """Entries of series added since mark, or None if it must be sent whole"""
+    buffer, position = mark
+    if isinstance(series, HistoryBuffer):
+        return series.records_since(position) if buffer is series else None
+    if buffer is not None:
+        return None
+    if position is None:
+        return list(series)
+    tail = []
+    for item in reversed(series):
+        if item is position:
+            tail.reverse()
+            return tail
+        tail.append(item)
+    return None
+
+
+class _StreamCursor:
+    """What one /stream client has been sent, so each later event carries only the changes"""
+    
+    def __init__(self, state: Dict):
+        self.state = state
+        self.marks = {field: _series_mark(state[field]) for field in _APPENDED_FIELDS}
+        self.price_marks = {symbol: _series_mark(history)
+                            for symbol, history in state['price_history'].items()}
+    
+    def delta(self, state: Dict) -> Dict:
+        """
+        Changes since the last call (or the snapshot)
+        
+        Replaced fields are included whole; appended ones go under 'appended' as
+        {'points': [...], 'length': n}, the new entries and the series length to trim to.
+        """
+        sent = self.state
+        delta = {field: state[field] for field in _REPLACED_FIELDS if state[field] is not sent[field]}
+        appended = {}
+        for field in _APPENDED_FIELDS:
+            series = state[field]
+            tail = _series_tail(series, self.marks[field])
+            if tail is None:
+                delta[field] = series
+            elif tail:
+                appended[field] = {'points': tail, 'length': len(series)}
+            self.marks[field] = _series_mark(series)
+        price_tails = {}
+        for symbol, history in state['price_history'].items():
+            tail = _series_tail(history, self.price_marks.get(symbol, (None, None)))
+            if tail is None:
+                tail = list(history)
+            if tail:
+                price_tails[symbol] = {'points': tail, 'length': len(history)}
+            self.price_marks[symbol] = _series_mark(history)
+        if price_tails:
+            appended['price_history'] = price_tails
+        if appended:
+            delta['appended'] = appended
+        self.state = state
+        return delta
+
+
+def _publish():
+    """Wake the connected dashboards; serialization happens on their threads"""
+    global _state_version
+    with _state_changed:
+        _state_version += 1
+        _state_changed.notify_all()
+
 # File to persist LLM conversations
 LLM_CONVERSATIONS_FILE = 'llm_conversations.json'
 
@@ -43,14 +189,18 @@ def load_llm_conversations():
 def save_llm_conversations():
     """Save LLM conversations to file"""
     try:
-        with open(LLM_CONVERSATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(trading_state['llm_conversations'], f, indent=2)
+        if orjson is not None:
+            with open(LLM_CONVERSATIONS_FILE, 'wb') as f:
+                f.write(orjson.dumps(trading_state['llm_conversations'], option=orjson.OPT_INDENT_2))
+        else:
+            with open(LLM_CONVERSATIONS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(trading_state['llm_conversations'], f, indent=2)
     except Exception as e:
         print(f"⚠️  Failed to save LLM conversations: {e}")
 
 
 def update_llm_conversation(decision: Dict):
-    """Add LLM conversation to history"""
+    """Add LLM conversation to history (swapped in as a new state dict, like update_trading_data)"""
     global trading_state
     
     conversation = {
@@ -61,63 +211,76 @@ def update_llm_conversation(decision: Dict):
         'actions': decision.get('actions', [])
     }
     
-    trading_state['llm_conversations'].append(conversation)
-    
-    # Keep only last 50 conversations
-    if len(trading_state['llm_conversations']) > 50:
-        trading_state['llm_conversations'] = trading_state['llm_conversations'][-50:]
+    # Keep only last 50 conversations; a new list, so a dashboard serializing
+    # the previous state never sees it change
+    state = dict(trading_state)
+    state['llm_conversations'] = (state['llm_conversations'] + [conversation])[-50:]
+    trading_state = state
     
     # Persist to file
     save_llm_conversations()
+    _publish()
 
 
 def update_trading_data(prices: Dict, positions: List, stats: Dict, 
                        closed_positions: List = None,
                        value_history: List = None,
                        price_history: Dict = None):
-    """Update the global trading state"""
+    """
+    Update the global trading state
+    
+    The arguments are stored by reference, not copied: callers pass fresh
+    prices/positions/stats objects each time and must not modify them later.
+    The new state is swapped in as one dict, and the server's own fallback
+    histories are copied before appending, so readers never see a mix of two
+    updates. Histories passed in by the bot are its live buffers and are
+    only ever appended to.
+    """
     global trading_state
+    state = dict(trading_state)
     
     # Use provided history if available, otherwise maintain our own
     if value_history is not None:
-        trading_state['value_history'] = value_history
+        state['value_history'] = value_history
     if price_history is not None:
-        trading_state['price_history'] = price_history
+        state['price_history'] = price_history
     
     timestamp = datetime.now().isoformat()
-    trading_state['last_update'] = timestamp
-    trading_state['prices'] = prices
-    trading_state['positions'] = positions
-    trading_state['stats'] = stats
+    state['last_update'] = timestamp
+    state['prices'] = prices
+    state['positions'] = positions
+    state['stats'] = stats
     
-    # Update price history (only if not provided from bot)
+    # Update price history (only if not provided from bot); copied first so a
+    # reader holding the previous state never sees its deques change
     if price_history is None:
+        price_histories = {symbol: deque(history, maxlen=100)
+                           for symbol, history in state['price_history'].items()}
         for symbol, price in prices.items():
-            if symbol not in trading_state['price_history']:
-                trading_state['price_history'][symbol] = []
+            if symbol not in price_histories:
+                # Keep only last 100 data points
+                price_histories[symbol] = deque(maxlen=100)
             
-            trading_state['price_history'][symbol].append({
+            price_histories[symbol].append({
                 'timestamp': timestamp,
                 'price': price
             })
-            
-            # Keep only last 100 data points
-            if len(trading_state['price_history'][symbol]) > 100:
-                trading_state['price_history'][symbol] = trading_state['price_history'][symbol][-100:]
+        state['price_history'] = price_histories
     
-    # Update value history (only if not provided from bot)
+    # Update value history (only if not provided from bot), copied likewise
     if value_history is None:
-        trading_state['value_history'].append({
+        state['value_history'] = deque(state['value_history'], maxlen=100)
+        state['value_history'].append({
             'timestamp': timestamp,
             'value': stats.get('total_value', 0)
         })
-        
-        if len(trading_state['value_history']) > 100:
-            trading_state['value_history'] = trading_state['value_history'][-100:]
     
     # Update closed trades
     if closed_positions:
-        trading_state['trades'] = closed_positions
+        state['trades'] = closed_positions
+    
+    trading_state = state
+    _publish()
 
 
 @app.route('/')
@@ -133,9 +296,10 @@ def index():
 @app.route('/api/status')
 def get_status():
     """Get current trading status"""
+    state = trading_state
     return jsonify({
-        'running': trading_state['running'],
-        'last_update': trading_state['last_update']
+        'running': state['running'],
+        'last_update': state['last_update']
     })
 
 
@@ -184,7 +348,43 @@ def get_llm_conversations():
 @app.route('/api/all')
 def get_all_data():
     """Get all data at once"""
-    return jsonify(trading_state)
+    # Same document as the first /stream event, so reuse its once-per-version payload
+    return Response(_state_payload()[2], mimetype='application/json')
+
+
+@app.route('/stream')
+def stream():
+    """
+    Server-sent events: the /api/all document on connect, then one 'delta'
+    event with only the changed fields each time the bot updates the state
+    
+    Each open stream holds a server thread, so at most SSE_MAX_STREAMS are
+    served; further dashboards get a 503 and fall back to polling /api/all.
+    """
+    if not _stream_slots.acquire(blocking=False):
+        return Response('Too many open streams, poll /api/all instead\n', status=503,
+                        mimetype='text/plain')
+    
+    def events():
+        version, state, payload = _state_payload()
+        cursor = _StreamCursor(state)
+        yield f"data: {payload}\n\n"
+        while True:
+            with _state_changed:
+                changed = _state_changed.wait_for(lambda: _state_version != version,
+                                                  timeout=SSE_KEEPALIVE)
+            if not changed:
+                yield ": keep-alive\n\n"
+                continue
+            version, state = _state_version, trading_state
+            delta = cursor.delta(state)
+            if delta:
+                yield f"event: delta\ndata: {_state_json(delta)}\n\n"
+    
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(_stream_slots.release)
+    return response
 
 
 def run_server(host='127.0.0.1', port=5000, debug=False):
@@ -193,7 +393,14 @@ def run_server(host='127.0.0.1', port=5000, debug=False):
     load_llm_conversations()
     
     trading_state['running'] = True
-    app.run(host=host, port=port, debug=debug, use_reloader=False)
+    # /stream never returns, so it needs a server with a thread per request:
+    # an ASGI bridge like asgiref's WsgiToAsgi runs every request on one
+    # shared thread and a single open dashboard would block all the others.
+    if waitress is not None and not debug:
+        # Each open /stream holds a thread, so leave room for the REST requests
+        waitress.serve(app, host=host, port=port, threads=SSE_MAX_STREAMS + 4)
+    else:
+        app.run(host=host, port=port, debug=debug, use_reloader=False, threaded=True)
 
 
 if __name__ == '__main__':